@@ -0,0 +1,303 @@
+""" Benchmarks of how machine construction, compilation and interpretation
+    scale with the number of states and inputs.
+
+    Each operation is timed over synthetic machines of every size given,
+    then run once more under tracemalloc to measure its peak memory. Results
+    are written as JSON, and can be compared against an earlier run with
+    --compare. From the project root:
+
+        python benchmarks/bench_scaling.py --output bench.json
+        python benchmarks/bench_scaling.py --compare bench.json
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from functools import reduce
+from operator import add
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from estado.input import Input
+from estado.machine import Machine
+from estado.pass_state import Pass
+from estado.resource_registry import Registry
+from estado.task_state import Task
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+DEFAULT_INPUTS = [100, 1000, 10000]
+
+# The number of states of the machine used to benchmark interpret_many
+BATCH_MACHINE_SIZE = 10
+
+
+def increment(x):
+    return x + 1
+
+
+def make_registry():
+    registry = Registry()
+    registry.register_function(increment, "increment")
+    return registry
+
+
+def make_states(size, registry):
+    """ Generate the states of a machine of Pass states ending with a Task
+        state, as Task states take an Input rather than a Result
+    """
+    for index in range(size):
+        if index == size - 1:
+            yield Task(
+                name=f"task_{index}",
+                resource="increment",
+                registry=registry
+            )
+        else:
+            yield Pass(name=f"pass_{index}")
+
+
+def make_machine(size, registry):
+    return Machine.from_states(make_states(size, registry))
+
+
+def construction_operations(size, registry):
+
+    def register():
+        machine = Machine()
+        for state in make_states(size, registry):
+            machine.register(state)
+
+    def from_states():
+        make_machine(size, registry)
+
+    def add_chaining():
+        reduce(add, make_states(max(size, 2), registry))
+
+    return {
+        "register": (register, None),
+        "from_states": (from_states, None),
+        "add_chaining": (add_chaining, None)
+    }
+
+
+def compilation_operations(size, registry):
+
+    def cold():
+        machine = make_machine(size, registry)
+        return (machine,)
+
+    def warm():
+        machine = make_machine(size, registry)
+        machine.compile()
+        return (machine,)
+
+    return {
+        "compile": (lambda machine: machine.compile(), cold),
+        "compile_cached": (lambda machine: machine.compile(), warm),
+        "compile_to": (
+            lambda machine: machine.compile_to(io.StringIO()),
+            cold
+        ),
+        "plan": (lambda machine: machine.plan(), cold)
+    }
+
+
+def interpretation_operations(size, registry):
+
+    def setup():
+        machine = make_machine(size, registry)
+        machine.plan()
+        return (machine,)
+
+    return {
+        "interpret": (
+            lambda machine: machine.interpret(input=Input(x=0)),
+            setup
+        )
+    }
+
+
+def batch_operations(inputs, registry):
+
+    def setup():
+        machine = make_machine(BATCH_MACHINE_SIZE, registry)
+        machine.plan()
+        return (machine,)
+
+    def interpret_loop(machine):
+        for x in range(inputs):
+            machine.interpret(input=Input(x=x))
+
+    def interpret_many(machine):
+        for _ in machine.interpret_many(Input(x=x) for x in range(inputs)):
+            pass
+
+    return {
+        "interpret_loop": (interpret_loop, setup),
+        "interpret_many": (interpret_many, setup)
+    }
+
+
+def measure(fn, setup, repeat):
+    """ Obtain the best time of fn over repeat runs, and its peak memory
+        over a separate run, excluding the memory allocated by setup
+    """
+    timings = []
+
+    for _ in range(repeat):
+        arguments = setup() if setup else ()
+        gc.collect()
+        started = time.perf_counter()
+        fn(*arguments)
+        timings.append(time.perf_counter() - started)
+
+    arguments = setup() if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    fn(*arguments)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(timings), peak
+
+
+def run(sizes, input_counts, repeat, operations=None):
+
+    registry = make_registry()
+    results = []
+
+    def record(name, fn, setup, states, inputs):
+        if operations and name not in operations:
+            return
+
+        seconds, peak = measure(fn, setup, repeat)
+        results.append({
+            "operation": name,
+            "states": states,
+            "inputs": inputs,
+            "seconds": seconds,
+            "peak_bytes": peak
+        })
+        print(
+            f"{name:>16} states={states:<7} inputs={inputs:<7} " \
+            f"{seconds:10.6f}s {peak / 1024:12.1f}KiB",
+            file=sys.stderr
+        )
+
+    for size in sizes:
+        for group in (construction_operations, compilation_operations,
+                      interpretation_operations):
+            for name, (fn, setup) in group(size, registry).items():
+                record(name, fn, setup, size, 1)
+
+    for inputs in input_counts:
+        for name, (fn, setup) in batch_operations(inputs, registry).items():
+            record(name, fn, setup, BATCH_MACHINE_SIZE, inputs)
+
+    return results
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """ Print the ratio of each timing and peak to that of a baseline run
+    """
+    key = lambda result: (
+        result["operation"], result["states"], result["inputs"]
+    )
+    previous = {key(result): result for result in baseline["results"]}
+
+    print(f"compared against {baseline.get('revision')}", file=sys.stderr)
+
+    for result in results:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+
+        time_ratio = result["seconds"] / max(before["seconds"], 1e-9)
+        peak_ratio = result["peak_bytes"] / max(before["peak_bytes"], 1)
+        print(
+            f"{result['operation']:>16} states={result['states']:<7} " \
+            f"inputs={result['inputs']:<7} time x{time_ratio:6.2f} " \
+            f"peak x{peak_ratio:6.2f}",
+            file=sys.stderr
+        )
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(",") if count]
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", type=parse_counts, default=DEFAULT_SIZES,
+        help="comma separated numbers of states"
+    )
+    parser.add_argument(
+        "--inputs", type=parse_counts, default=DEFAULT_INPUTS,
+        help="comma separated numbers of inputs for batch interpretation"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="number of timed runs of each operation"
+    )
+    parser.add_argument(
+        "--operations", type=lambda value: value.split(","), default=None,
+        help="comma separated operations to run, all by default"
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="file to write results to, standard output by default"
+    )
+    parser.add_argument(
+        "--compare", default=None,
+        help="results of an earlier run to compare against"
+    )
+    arguments = parser.parse_args(argv)
+
+    results = run(
+        arguments.sizes,
+        arguments.inputs,
+        arguments.repeat,
+        arguments.operations
+    )
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "repeat": arguments.repeat,
+        "results": results
+    }
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            compare(results, json.load(baseline_file))
+
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import json
+import os
+
+from estado.choice_state import Choice
+from estado.machine import Machine, OperationalError
+from estado.map_state import Map
+from estado.parallel_state import Parallel
+from estado.pass_state import Pass
+from estado.resource_registry import Registry
+from estado.state import InvalidStateTypeException
+from estado.state_map import DeferredState
+from estado.task_state import Task
+from estado.wait_state import Wait
+
+# The state classes used to load each type of state
+STATE_TYPES = {
+    "Pass": Pass,
+    "Task": Task,
+    "Choice": Choice,
+    "Map": Map,
+    "Parallel": Parallel,
+    "Wait": Wait
+}
+
+
+def read_document(document_or_path):
+    """ Obtain an Amazon States Language document given either as a
+        dictionary, a file object, or the path of a JSON file
+    """
+    if isinstance(document_or_path, dict):
+        return document_or_path
+
+    if hasattr(document_or_path, "read"):
+        return json.load(document_or_path)
+
+    with open(os.fspath(document_or_path)) as document_file:
+        return json.load(document_file)
+
+
+def index_registries(registry):
+    """ Index a registry, or an iterable of registries, by name
+    """
+    if registry is None:
+        return {}
+
+    if isinstance(registry, Registry):
+        registry = (registry,)
+
+    return {registry_.name: registry_ for registry_ in registry}
+
+
+def load_state(name, definition, registries, pass_result_paths=False):
+    """ Build a state object from its Amazon States Language definition.
+        With pass_result_paths set, the result of a Pass state is placed at
+        its ResultPath, as in the Amazon States Language, rather than only
+        output when its input is empty.
+    """
+    type_ = definition.get("Type")
+
+    if type_ not in STATE_TYPES:
+        raise InvalidStateTypeException(type_)
+
+    return STATE_TYPES[type_].from_definition(
+        name, definition, registries, pass_result_paths=pass_result_paths
+    )
+
+
+def asynchronous_definition(definition, registries):
+    """ Whether interpreting a state awaits a coroutine function, found
+        from its Amazon States Language definition without building it
+    """
+    type_ = definition.get("Type")
+
+    if type_ == "Task":
+        registry_name, _, resource = definition["Resource"].partition(":")
+        registry = registries.get(registry_name)
+        return registry is not None and \
+            registry.is_coroutine_function(resource)
+
+    if type_ == "Map":
+        documents = (definition["Iterator"],)
+    elif type_ == "Parallel":
+        documents = definition["Branches"]
+    else:
+        return False
+
+    return any(
+        asynchronous_definition(state, registries)
+        for document in documents
+        for state in document["States"].values()
+    )
+
+
+def load_machine(document_or_path, registry=None, lazy=False,
+                 machine_class=Machine, pass_result_paths=False):
+    """ Build a machine from an Amazon States Language document.
+
+        Task resources, such as "registry:add_two", are resolved against
+        the registries given, by name. With lazy set, states are only
+        built when first looked up or interpreted. With pass_result_paths
+        set, Pass states place their result at their ResultPath.
+    """
+    document = read_document(document_or_path)
+    registries = index_registries(registry)
+
+    definitions = document["States"]
+    start_at = document["StartAt"]
+
+    if start_at not in definitions:
+        raise OperationalError(
+            f"StartAt names an unknown state {start_at}"
+        )
+
+    # A machine starts at its first state, so StartAt is registered first
+    names = [start_at]
+    names.extend(name for name in definitions if name != start_at)
+
+    machine = machine_class()
+
+    if lazy:
+        states = (
+            DeferredState(
+                name, definitions[name], registries, machine.states,
+                pass_result_paths
+            )
+            for name in names
+        )
+    else:
+        states = (
+            load_state(
+                name, definitions[name], registries, pass_result_paths
+            )
+            for name in names
+        )
+
+    machine.extend(states, link=False)
+
+    return machine
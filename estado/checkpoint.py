@@ -0,0 +1,109 @@
+import pickle
+import sqlite3
+from threading import Lock
+
+
+class CheckpointLog:
+    """ An append-only log of the state transitions of executions, stored
+        in SQLite, from which interrupted executions can be resumed.
+
+        Each transition records the output of the state completed. Records
+        are written in batches of batch_size, and whenever an execution
+        finishes or fails, so that a process dying mid-execution loses at
+        most the last batch_size - 1 transitions of the executions it was
+        running, which are then interpreted again on resume.
+    """
+
+    def __init__(self, path=":memory:", batch_size=64):
+
+        self.path = path
+        self.batch_size = batch_size
+
+        self._pending = []
+        self._lock = Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS transitions (" \
+            "execution_id TEXT NOT NULL, " \
+            "sequence INTEGER NOT NULL, " \
+            "state TEXT, " \
+            "output BLOB, " \
+            "done INTEGER NOT NULL, " \
+            "PRIMARY KEY (execution_id, sequence))"
+        )
+        self._connection.commit()
+
+    def record(self, execution_id, sequence, state, output, done=False):
+        """ Append the output of a state completed by an execution. The
+            first record of an execution, with sequence 0 and no state,
+            holds its input.
+        """
+        with self._lock:
+            self._pending.append((
+                execution_id,
+                sequence,
+                state,
+                pickle.dumps(output),
+                int(done)
+            ))
+
+            if len(self._pending) >= self.batch_size:
+                self._write()
+
+
+    def flush(self):
+
+        with self._lock:
+            self._write()
+
+
+    def last(self, execution_id):
+        """ Obtain the sequence, state, output and completion of the last
+            transition recorded for an execution, or None
+        """
+        with self._lock:
+            self._write()
+
+            row = self._connection.execute(
+                "SELECT sequence, state, output, done FROM transitions " \
+                "WHERE execution_id = ? ORDER BY sequence DESC LIMIT 1",
+                (execution_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        sequence, state, output, done = row
+        return sequence, state, pickle.loads(output), bool(done)
+
+
+    def close(self):
+
+        with self._lock:
+            self._write()
+            self._connection.close()
+
+
+    def _write(self):
+
+        if not self._pending:
+            return
+
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO transitions VALUES (?, ?, ?, ?, ?)",
+            self._pending
+        )
+        self._connection.commit()
+        self._pending.clear()
+
+
+    def __reduce__(self):
+        # Worker processes open their own connection to the same database
+        return (CheckpointLog, (self.path, self.batch_size))
+
+
+    def __repr__(self):
+        return f"<CheckpointLog:{self.path}>"
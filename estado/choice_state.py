@@ -0,0 +1,355 @@
+import operator
+import re
+
+from estado.paths import MISSING, compile_path, definition_paths
+from estado.state import State
+
+# Comparison operators of choice rules, by the type of value they compare
+STRING_COMPARISONS = {
+    "StringEquals": operator.eq,
+    "StringLessThan": operator.lt,
+    "StringGreaterThan": operator.gt,
+    "StringLessThanEquals": operator.le,
+    "StringGreaterThanEquals": operator.ge
+}
+
+NUMERIC_COMPARISONS = {
+    "NumericEquals": operator.eq,
+    "NumericLessThan": operator.lt,
+    "NumericGreaterThan": operator.gt,
+    "NumericLessThanEquals": operator.le,
+    "NumericGreaterThanEquals": operator.ge
+}
+
+BOOLEAN_COMPARISONS = {
+    "BooleanEquals": operator.eq
+}
+
+# Comparisons evaluated with a lookup table when they select a rule
+EQUALITY_COMPARISONS = {
+    "StringEquals": "string",
+    "NumericEquals": "numeric",
+    "BooleanEquals": "boolean"
+}
+
+
+def value_kind(value):
+    """ The kind of a value in the sense of choice rule comparisons, or None
+    """
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "numeric"
+    return None
+
+
+def is_kind(kind):
+    return lambda value: value_kind(value) == kind
+
+
+TYPE_TESTS = {
+    "IsString": is_kind("string"),
+    "IsNumeric": is_kind("numeric"),
+    "IsBoolean": is_kind("boolean"),
+    "IsNull": lambda value: value is None
+}
+
+
+def compile_matcher(pattern):
+    """ Compile a StringMatches pattern, in which * matches any sequence of
+        characters and \\* a literal *, into a regular expression matcher
+    """
+    parts = re.split(r"(\\\*|\*)", pattern)
+    expression = "".join(
+        ".*" if part == "*" else re.escape("*" if part == "\\*" else part)
+        for part in parts
+    )
+    return re.compile(expression, re.DOTALL).fullmatch
+
+
+def compile_rule(rule):
+    """ Compile a choice rule, without its Next field, into a predicate on
+        the data passed to the Choice state
+    """
+    if "And" in rule:
+        predicates = [compile_rule(inner) for inner in rule["And"]]
+        return lambda data: all(predicate(data) for predicate in predicates)
+
+    if "Or" in rule:
+        predicates = [compile_rule(inner) for inner in rule["Or"]]
+        return lambda data: any(predicate(data) for predicate in predicates)
+
+    if "Not" in rule:
+        predicate = compile_rule(rule["Not"])
+        return lambda data: not predicate(data)
+
+    if "Variable" not in rule:
+        raise InvalidChoiceRuleException(rule)
+
+    get = compile_path(rule["Variable"])
+
+    if "IsPresent" in rule:
+        expected = rule["IsPresent"]
+        return lambda data: (get(data) is not MISSING) == expected
+
+    for test_name, test in TYPE_TESTS.items():
+        if test_name in rule:
+            expected = rule[test_name]
+
+            def type_test(data, test=test, expected=expected):
+                value = get(data)
+                return value is not MISSING and test(value) == expected
+
+            return type_test
+
+    if "StringMatches" in rule:
+        match = compile_matcher(rule["StringMatches"])
+
+        def matches(data):
+            value = get(data)
+            return isinstance(value, str) and match(value) is not None
+
+        return matches
+
+    for kind, comparisons in (("string", STRING_COMPARISONS),
+                              ("numeric", NUMERIC_COMPARISONS),
+                              ("boolean", BOOLEAN_COMPARISONS)):
+        for comparison_name, compare in comparisons.items():
+            if comparison_name not in rule:
+                continue
+
+            expected = rule[comparison_name]
+
+            def comparison(data, kind=kind, compare=compare,
+                           expected=expected):
+                value = get(data)
+                return value_kind(value) == kind and compare(value, expected)
+
+            return comparison
+
+    raise InvalidChoiceRuleException(rule)
+
+
+def compile_choices(choices):
+    """ Compile the rules of a Choice state into a function returning the
+        index of the first rule matching the data it is given, or None.
+
+        Rules comparing a variable for equality with a string, number or
+        boolean are grouped by variable into tables from value to the
+        first rule selecting it, so that the cost of dispatch depends on
+        the number of variables rather than the number of rules. Other
+        rules are evaluated in order, only as long as they come before the
+        best rule found in the tables.
+    """
+    tables = {}
+    ordered = []
+
+    for index, rule in enumerate(choices):
+        equality = [name for name in EQUALITY_COMPARISONS if name in rule]
+
+        if "Variable" in rule and len(equality) == 1 and len(rule) == 3:
+            comparison_name, = equality
+            value = rule[comparison_name]
+
+            if value_kind(value) == EQUALITY_COMPARISONS[comparison_name]:
+                table = tables.setdefault(rule["Variable"], {})
+                table.setdefault((value_kind(value), value), index)
+                continue
+
+        ordered.append((index, compile_rule(rule)))
+
+    lookups = [
+        (compile_path(variable), table) for variable, table in tables.items()
+    ]
+    no_match = len(choices)
+
+    def dispatch(data):
+        best = no_match
+
+        for get, table in lookups:
+            value = get(data)
+            kind = value_kind(value)
+
+            if kind is not None:
+                index = table.get((kind, value), no_match)
+                if index < best:
+                    best = index
+
+        for index, predicate in ordered:
+            if index >= best:
+                break
+            if predicate(data):
+                best = index
+                break
+
+        return None if best == no_match else best
+
+    return dispatch
+
+
+class Choice(State):
+    """ A state choosing the state to transition to from its input, with
+        rules in the Amazon States Language format, such as
+        {"Variable": "$.x", "NumericEquals": 1, "Next": "One"}. The input
+        is passed on unchanged.
+    """
+
+    __slots__ = ("choices", "default", "_dispatch")
+
+    _transient_slots = ("_dispatch",)
+
+    def __init__(self, choices=(), default=None, name="", input_path=None,
+                 output_path=None):
+
+        state_config = {
+            "name": name,
+            "type": "Choice",
+            "input_path": input_path,
+            "output_path": output_path
+        }
+
+        State.__init__(self, state_config)
+
+        self.choices = list(choices)
+        self.default = default
+        self._dispatch = None
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Choice state from its Amazon States Language definition
+        """
+        return cls(
+            choices=definition["Choices"],
+            default=definition.get("Default"),
+            name=name,
+            **definition_paths(definition)
+        )
+
+
+    def terminal(self):
+        return False
+
+
+    def validate(self):
+
+        if not self.choices and self.default is None:
+            raise InvalidChoiceRuleException(
+                None, f"Choice state {self.name} has no rules and no default"
+            )
+
+        for rule in self.choices:
+            if "Next" not in rule:
+                raise InvalidChoiceRuleException(
+                    rule, f"Choice rule {rule} has no Next state"
+                )
+
+
+    def transitions(self):
+
+        # Rules without a Next state are reported by validate
+        targets = tuple(
+            rule["Next"] for rule in self.choices if "Next" in rule
+        )
+
+        if self.default is not None:
+            targets += (self.default,)
+
+        return targets
+
+
+    def choose(self, input=None):
+        """ Obtain the name of the state to transition to from an input
+        """
+        if self._dispatch is None:
+            self._dispatch = compile_choices(self.choices)
+
+        index = self._dispatch(input)
+
+        if index is not None:
+            return self.choices[index]["Next"]
+
+        if self.default is None:
+            raise NoChoiceMatchedException(self.name)
+
+        return self.default
+
+
+    def router(self, index):
+        """ Obtain a function from an input to the position of the state to
+            transition to, with the names of the states resolved to
+            positions in index once.
+        """
+        from estado.machine import OperationalError
+
+        dispatch = compile_choices(self.choices)
+
+        targets = [rule["Next"] for rule in self.choices]
+        if self.default is not None:
+            targets.append(self.default)
+
+        for target in targets:
+            if target not in index:
+                raise OperationalError(
+                    f"State {self.name} transitions to unknown state {target}"
+                )
+
+        positions = [index[rule["Next"]] for rule in self.choices]
+        default = index.get(self.default)
+        name = self.name
+
+        def route(input):
+            choice = dispatch(input)
+
+            if choice is not None:
+                return positions[choice]
+
+            if default is None:
+                raise NoChoiceMatchedException(name)
+
+            return default
+
+        return route
+
+
+    def interpret(self, input=None):
+        return input
+
+
+    def compile(self):
+
+        compiled = {
+            "Type": self.type,
+            "Choices": self.choices
+        }
+
+        if self.default is not None:
+            compiled["Default"] = self.default
+
+        if self.input_path is not None:
+            compiled["InputPath"] = self.input_path
+
+        if self.output_path is not None:
+            compiled["OutputPath"] = self.output_path
+
+        return {
+            self.name: compiled
+        }
+
+
+class InvalidChoiceRuleException(Exception):
+
+    def __init__(self, rule, message=None):
+        if message is None:
+            message = f"Choice rule {rule} has no supported comparison"
+        Exception.__init__(self, message)
+
+
+class NoChoiceMatchedException(Exception):
+
+    def __init__(self, name):
+        message = f"No choice rule of state {name} matched, " \
+            f"and it has no default"
+        Exception.__init__(self, message)
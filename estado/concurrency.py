@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+from itertools import islice
+
+# Runs the machine shipped to a worker process by initialize_worker
+_worker_run = None
+
+# Run the machines loaded by the worker processes of executors not made
+# for one machine, by the digest of their pickled form, the least recently
+# used first, of which at most SHARED_WORKER_RUNS are kept
+_shared_worker_runs = OrderedDict()
+SHARED_WORKER_RUNS = 8
+
+# The executor not made for one machine whose worker the current thread is
+_shared_worker = threading.local()
+
+
+def bounded_map(fn, iterable, executor, window, ordered=True):
+    """ Lazily map fn over an iterable using an executor, keeping at most
+        window calls in flight so that memory use does not depend on the
+        length of the iterable.
+
+        With ordered set, results are yielded in the order of the iterable,
+        otherwise they are yielded as soon as they complete.
+    """
+    iterator = iter(iterable)
+    submit = executor.submit
+
+    def refill(pending, count):
+        add = pending.append if ordered else pending.add
+        for item in islice(iterator, count):
+            add(submit(fn, item))
+
+    pending = deque() if ordered else set()
+    refill(pending, window)
+
+    try:
+        if ordered:
+            while pending:
+                result = pending.popleft().result()
+                refill(pending, 1)
+                yield result
+        else:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                refill(pending, len(done))
+                for future in done:
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def chunked(iterable, size):
+    """ Lazily split an iterable into lists of at most size items
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def run_chunk(run, inputs):
+    return [run(input) for input in inputs]
+
+
+def initialize_worker(payload, initializer=None, initargs=()):
+    """ Load a pickled machine in a worker process and build its plan,
+        once per process, before running the optional initializer.
+    """
+    global _worker_run
+
+    machine = pickle.loads(payload)
+    _worker_run = partial(machine.plan().run, checkpoint=machine.checkpoint)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_worker_chunk(inputs):
+    return run_chunk(_worker_run, inputs)
+
+
+def run_shared_chunk(executor, run, inputs):
+    """ Run a chunk on a worker thread of an executor shared between
+        machines, marking the thread as one of its workers
+    """
+    _shared_worker.executor = executor
+    return run_chunk(run, inputs)
+
+
+def runs_chunks_of(executor):
+    """ Whether the current thread is a worker of an executor shared between
+        machines, on which waiting for other chunks may never end, as they
+        are queued behind the chunk the thread runs
+    """
+    return getattr(_shared_worker, "executor", None) is executor
+
+
+def ship_machine(machine):
+    """ Write a pickled machine to a temporary file, from which each worker
+        process of an executor shared between machines loads it once.
+        Returns the digest of the pickled machine and the path of the file,
+        which the caller removes.
+    """
+    payload = pickle.dumps(machine)
+    descriptor, path = tempfile.mkstemp(suffix=".pickle")
+
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(payload)
+
+    return hashlib.sha256(payload).digest(), path
+
+
+def run_shared_worker_chunk(digest, path, inputs):
+    """ Run a chunk in a worker process of an executor shared between
+        machines, loading the machine shipped to path once per process
+    """
+    run = _shared_worker_runs.get(digest)
+
+    if run is None:
+        with open(path, "rb") as file:
+            machine = pickle.load(file)
+
+        run = _shared_worker_runs[digest] = partial(
+            machine.plan().run, checkpoint=machine.checkpoint
+        )
+
+        if len(_shared_worker_runs) > SHARED_WORKER_RUNS:
+            _shared_worker_runs.popitem(last=False)
+    else:
+        _shared_worker_runs.move_to_end(digest)
+
+    return run_chunk(run, inputs)
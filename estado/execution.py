@@ -0,0 +1,492 @@
+import asyncio
+from time import sleep, time
+
+from estado.hash_utils import unique_name
+
+# The position of the state following a terminal state
+TERMINAL = -1
+
+# The transition of states whose next state depends on their output
+ROUTED = -2
+
+
+def recover(recoveries, position, attempts, data, error):
+    """ Recover from an error raised by the state at a position with its
+        Retry and Catch rules, given the attempts made by each of its
+        retriers, or None. Returns the number of seconds to wait, and the
+        position, attempts and data to continue with, or raises the error
+        again when the state has no rule handling it.
+    """
+    recovery = recoveries[position]
+
+    if recovery is None:
+        raise error
+
+    if attempts is None:
+        attempts = {}
+
+    delay, target, data = recovery(error, attempts, data)
+
+    if target != position:
+        attempts = None
+
+    return delay, target, attempts, data
+
+
+class Execution:
+    """ The context of a single execution of a plan: the position of the
+        current state, the data it is given as input, and timing.
+
+        Executions hold all of the state of a run, so that a machine and
+        its plan are not modified while interpreting, and can be shared by
+        any number of concurrent executions. The position and data are
+        kept in local variables while running, and stored back when the
+        execution finishes or fails.
+    """
+
+    __slots__ = (
+        "plan", "_id", "profiler", "checkpoint", "sequence", "position",
+        "data", "output", "error", "attempts", "started", "finished"
+    )
+
+    def __init__(self, plan, input=None, profiler=None, id=None,
+                 checkpoint=None):
+
+        self.plan = plan
+        self._id = id
+        self.profiler = profiler
+        self.checkpoint = checkpoint
+        self.sequence = 0
+
+        self.position = plan.start
+        self.data = input
+        self.output = None
+        self.error = None
+        self.attempts = None
+
+        self.started = None
+        self.finished = None
+
+    @property
+    def id(self):
+        # Allocated on first use, as most executions are never looked up
+        if self._id is None:
+            self._id = unique_name()
+        return self._id
+
+
+    @property
+    def state(self):
+        """ The name of the current state, or None once finished
+        """
+        if self.position == TERMINAL:
+            return None
+        return self.plan.names[self.position]
+
+
+    @property
+    def done(self):
+        return self.position == TERMINAL
+
+
+    @property
+    def duration(self):
+        if self.started is None:
+            return None
+        return (self.finished or time()) - self.started
+
+
+    def run(self):
+        """ Interpret states from the current one until a terminal state,
+            passing the output of each state as the input of the state it
+            transitions to, and return the output of the last state.
+
+            Retries of failed states wait on the calling thread, or on the
+            event loop with run_async. Executions run by a Scheduler are
+            parked instead, leaving the thread to other executions.
+        """
+        if self.profiler is not None or self.checkpoint is not None:
+            return self._run_instrumented()
+
+        handlers = self.plan.handlers
+        transitions = self.plan.transitions
+        routers = self.plan.routers
+        recoveries = self.plan.recoveries
+        position = self.position
+        data = self.data
+        output = self.output
+        attempts = self.attempts
+
+        self.started = time()
+
+        try:
+            while position != TERMINAL:
+                try:
+                    output = handlers[position](input=data)
+                except Exception as error:
+                    delay, position, attempts, data = recover(
+                        recoveries, position, attempts, data, error
+                    )
+                    if delay:
+                        sleep(delay)
+                    continue
+
+                # Routers are given the input of the state rather than its
+                # output, as the rules of Choice states apply to their input
+                transition = transitions[position]
+                if transition == ROUTED:
+                    transition = routers[position](data)
+                position = transition
+
+                data = output
+                attempts = None
+        except Exception as error:
+            self.error = error
+            raise
+        finally:
+            self.position = position
+            self.data = data
+            self.attempts = attempts
+            self.finished = time()
+
+        self.output = output
+        return output
+
+
+    def advance(self, now):
+        """ Interpret states until the execution reaches a Wait state or a
+            terminal state. The execution is then past the Wait state, and
+            the number of seconds to wait from now, in seconds since the
+            epoch, is returned, or None once the execution is done. The
+            profiler and checkpoint log of the execution are not used.
+        """
+        handlers = self.plan.handlers
+        transitions = self.plan.transitions
+        routers = self.plan.routers
+        waits = self.plan.waits
+        recoveries = self.plan.recoveries
+        position = self.position
+        data = self.data
+        output = self.output
+        attempts = self.attempts
+
+        if self.started is None:
+            self.started = time()
+
+        try:
+            while position != TERMINAL:
+                wait = waits[position]
+
+                if wait is None:
+                    try:
+                        output = handlers[position](input=data)
+                    except Exception as error:
+                        delay, position, attempts, data = recover(
+                            recoveries, position, attempts, data, error
+                        )
+                        if delay:
+                            return delay
+                        continue
+                else:
+                    delay, output = wait(data, now)
+
+                transition = transitions[position]
+                if transition == ROUTED:
+                    transition = routers[position](data)
+                position = transition
+
+                data = output
+                attempts = None
+
+                if wait is not None:
+                    self.output = output
+                    return delay
+        except Exception as error:
+            self.error = error
+            self.finished = time()
+            raise
+        finally:
+            self.position = position
+            self.data = data
+            self.attempts = attempts
+
+        self.output = output
+        self.finished = time()
+        return None
+
+
+    async def run_async(self):
+        """ Interpret states from a coroutine, awaiting the interpret_async
+            method of each state.
+        """
+        if self.profiler is not None or self.checkpoint is not None:
+            return await self._run_async_instrumented()
+
+        handlers = self.plan.async_handlers
+        transitions = self.plan.transitions
+        routers = self.plan.routers
+        recoveries = self.plan.recoveries
+        position = self.position
+        data = self.data
+        output = self.output
+        attempts = self.attempts
+
+        self.started = time()
+
+        try:
+            while position != TERMINAL:
+                try:
+                    output = await handlers[position](input=data)
+                except Exception as error:
+                    delay, position, attempts, data = recover(
+                        recoveries, position, attempts, data, error
+                    )
+                    if delay:
+                        await asyncio.sleep(delay)
+                    continue
+
+                transition = transitions[position]
+                if transition == ROUTED:
+                    transition = routers[position](data)
+                position = transition
+
+                data = output
+                attempts = None
+        except Exception as error:
+            self.error = error
+            raise
+        finally:
+            self.position = position
+            self.data = data
+            self.attempts = attempts
+            self.finished = time()
+
+        self.output = output
+        return output
+
+
+    def _run_instrumented(self):
+        """ Interpret states reporting each of them to the profiler, and
+            recording each transition to the checkpoint log, of the
+            execution, either of which may be None
+        """
+        names = self.plan.names
+        fused = self.plan.fused
+        handlers = self.plan.handlers
+        transitions = self.plan.transitions
+        routers = self.plan.routers
+        recoveries = self.plan.recoveries
+        position = self.position
+        data = self.data
+        output = self.output
+        attempts = self.attempts
+
+        profiler = self.profiler
+        checkpoint = self.checkpoint
+
+        if profiler is not None:
+            before = profiler.before
+            after = profiler.after
+            record = profiler.record
+            clock = profiler.clock
+
+        if checkpoint is not None and self.sequence == 0:
+            checkpoint.record(self.id, 0, None, data)
+
+        self.started = time()
+
+        try:
+            while position != TERMINAL:
+                name = names[position]
+
+                try:
+                    if profiler is None:
+                        output = handlers[position](input=data)
+                    else:
+                        if before is not None:
+                            before(name, data)
+
+                        started = clock()
+                        try:
+                            output = handlers[position](input=data)
+                        except Exception:
+                            record(
+                                name, data, None, clock() - started,
+                                failed=True, fused=fused.get(name)
+                            )
+                            raise
+                        duration = clock() - started
+
+                        record(
+                            name, data, output, duration,
+                            fused=fused.get(name)
+                        )
+
+                        if after is not None:
+                            after(name, data, output, duration)
+                except Exception as error:
+                    delay, position, attempts, data = recover(
+                        recoveries, position, attempts, data, error
+                    )
+                    if delay:
+                        sleep(delay)
+                    continue
+
+                transition = transitions[position]
+                if transition == ROUTED:
+                    transition = routers[position](data)
+                position = transition
+
+                data = output
+                attempts = None
+
+                if checkpoint is not None:
+                    self.sequence += 1
+                    checkpoint.record(
+                        self.id, self.sequence, name, output,
+                        done=position == TERMINAL
+                    )
+        except Exception as error:
+            self.error = error
+            raise
+        finally:
+            self.position = position
+            self.data = data
+            self.attempts = attempts
+            self.finished = time()
+
+            if checkpoint is not None:
+                checkpoint.flush()
+
+        self.output = output
+        return output
+
+
+    async def _run_async_instrumented(self):
+        # Durations include time spent waiting on other coroutines
+        names = self.plan.names
+        fused = self.plan.fused
+        handlers = self.plan.async_handlers
+        transitions = self.plan.transitions
+        routers = self.plan.routers
+        recoveries = self.plan.recoveries
+        position = self.position
+        data = self.data
+        output = self.output
+        attempts = self.attempts
+
+        profiler = self.profiler
+        checkpoint = self.checkpoint
+
+        if profiler is not None:
+            before = profiler.before
+            after = profiler.after
+            record = profiler.record
+            clock = profiler.clock
+
+        if checkpoint is not None and self.sequence == 0:
+            checkpoint.record(self.id, 0, None, data)
+
+        self.started = time()
+
+        try:
+            while position != TERMINAL:
+                name = names[position]
+
+                try:
+                    if profiler is None:
+                        output = await handlers[position](input=data)
+                    else:
+                        if before is not None:
+                            before(name, data)
+
+                        started = clock()
+                        try:
+                            output = await handlers[position](input=data)
+                        except Exception:
+                            record(
+                                name, data, None, clock() - started,
+                                failed=True, fused=fused.get(name)
+                            )
+                            raise
+                        duration = clock() - started
+
+                        record(
+                            name, data, output, duration,
+                            fused=fused.get(name)
+                        )
+
+                        if after is not None:
+                            after(name, data, output, duration)
+                except Exception as error:
+                    delay, position, attempts, data = recover(
+                        recoveries, position, attempts, data, error
+                    )
+                    if delay:
+                        await asyncio.sleep(delay)
+                    continue
+
+                transition = transitions[position]
+                if transition == ROUTED:
+                    transition = routers[position](data)
+                position = transition
+
+                data = output
+                attempts = None
+
+                if checkpoint is not None:
+                    self.sequence += 1
+                    checkpoint.record(
+                        self.id, self.sequence, name, output,
+                        done=position == TERMINAL
+                    )
+        except Exception as error:
+            self.error = error
+            raise
+        finally:
+            self.position = position
+            self.data = data
+            self.attempts = attempts
+            self.finished = time()
+
+            if checkpoint is not None:
+                checkpoint.flush()
+
+        self.output = output
+        return output
+
+
+    @classmethod
+    def resume(cls, plan, checkpoint, id, profiler=None):
+        """ Obtain an execution continuing from the last transition recorded
+            for it in a checkpoint log. The execution is not run.
+        """
+        from estado.machine import OperationalError
+
+        last = checkpoint.last(id)
+
+        if last is None:
+            raise OperationalError(
+                f"There is no checkpoint for execution {id}"
+            )
+
+        sequence, state, output, done = last
+
+        execution = cls(plan, output, profiler, id, checkpoint)
+        execution.sequence = sequence
+
+        if done:
+            execution.position = TERMINAL
+            execution.output = output
+        elif state is not None:
+            if state not in plan.index:
+                raise OperationalError(
+                    f"Execution {id} stopped at unknown state {state}"
+                )
+            execution.position = plan.follow(plan.index[state], output)
+
+        return execution
+
+
+    def __repr__(self):
+        return f"<Execution:{self.id}|{self.state or 'done'}>"
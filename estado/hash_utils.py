@@ -1,10 +1,58 @@
-from hashlib import sha1
+import json
+import os
+import re
+from hashlib import sha1, sha256
+from itertools import count
 from random import randint
+from secrets import token_hex
 from time import time
+from weakref import WeakSet
+
+
+class IdAllocator:
+    """ Allocates names from a counter. Names are unique within a process,
+        and prefixed with a random session token, regenerated in forked
+        processes, so that names allocated by different processes do not
+        collide. An optional namespace is prepended to each name.
+    """
+
+    _allocators = WeakSet()
+
+    def __init__(self, namespace=""):
+
+        self.namespace = namespace
+        self._reset()
+        IdAllocator._allocators.add(self)
+
+    def _reset(self):
+        namespace = f"{self.namespace}-" if self.namespace else ""
+        self.prefix = f"{namespace}{token_hex(4)}-"
+        self._counter = count()
+
+    def __call__(self):
+        return f"{self.prefix}{next(self._counter)}"
+
+    def __repr__(self):
+        return f"<IdAllocator:{self.prefix}>"
+
+
+def _reset_allocators():
+    for allocator in IdAllocator._allocators:
+        allocator._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_allocators)
+
+
+# The allocator used to name unnamed states and registry functions
+unique_name = IdAllocator()
 
 
 def slug_hash():
-    """ A utility function to obtain unique-ish names 
+    """ A utility function to obtain unique-ish names. This hashes the
+        current time, so names obtained within the same second collide
+        frequently, use unique_name instead.
     """
     m = sha1()
 
@@ -18,3 +66,101 @@ def slug_hash():
     random_second = randint(0, 100)
     
     return f"{digest}-{random_first}-{random_second}"
+
+
+# Names allocated by unique_name without a namespace, in any process, and
+# names obtained from slug_hash
+GENERATED_NAME = re.compile(r"[0-9a-f]{8}-\d+|[0-9a-f]{7}-\d{1,3}-\d{1,3}")
+
+
+def canonical_name(name, names):
+    """ Obtain a label numbering a generated state name in order of first
+        appearance, recorded in names, or the name itself when it was not
+        generated
+    """
+    if not isinstance(name, str) or not GENERATED_NAME.fullmatch(name):
+        return name
+    return names.setdefault(name, f"#{len(names)}")
+
+
+def canonical_document(document, names):
+    """ Obtain a compiled state machine with the generated names of its
+        states replaced by labels, where they name states: StartAt, the
+        keys of States and the fields transitioning to a state, including
+        in the machines of Map and Parallel states. Other strings, such as
+        results, are left as they are.
+    """
+    return {
+        **document,
+        "StartAt": canonical_name(document["StartAt"], names),
+        "States": [
+            [canonical_name(name, names), canonical_state(state, names)]
+            for name, state in document["States"].items()
+        ]
+    }
+
+
+def canonical_state(definition, names):
+
+    definition = dict(definition)
+
+    for field in ("Next", "Default"):
+        if field in definition:
+            definition[field] = canonical_name(definition[field], names)
+
+    for field in ("Choices", "Catch"):
+        if field in definition:
+            definition[field] = [
+                {**rule, "Next": canonical_name(rule["Next"], names)}
+                if "Next" in rule else rule
+                for rule in definition[field]
+            ]
+
+    if "Iterator" in definition:
+        definition["Iterator"] = canonical_document(
+            definition["Iterator"], names
+        )
+
+    if "Branches" in definition:
+        definition["Branches"] = [
+            canonical_document(branch, names)
+            for branch in definition["Branches"]
+        ]
+
+    return definition
+
+
+def fingerprint(document):
+    """ A digest of a compiled state machine standing for its structure,
+        which does not depend on generated state names, nor on the order
+        of the fields of each state, but does on the order of the states
+    """
+    canonical = json.dumps(
+        canonical_document(document, {}),
+        sort_keys=True,
+        separators=(",", ":")
+    )
+
+    return sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def freeze(value):
+    """ Obtain a hashable key standing for a value, converting dictionaries,
+        lists, tuples and sets recursively. Values of different types are
+        given different keys, even when they compare equal, so that 1, 1.0
+        and True are told apart. A TypeError is raised for unhashable values
+        of other types.
+    """
+    if isinstance(value, dict):
+        return (dict, frozenset(
+            (freeze(key), freeze(item)) for key, item in value.items()
+        ))
+
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(freeze(item) for item in value))
+
+    if isinstance(value, (set, frozenset)):
+        return (type(value), frozenset(freeze(item) for item in value))
+
+    hash(value)
+    return (type(value), value)
@@ -1,5 +1,7 @@
 class Input:
 
+    __slots__ = ("inputs",)
+
     def __init__(self, **inputs):
 
         self.inputs = inputs
@@ -1,4 +1,22 @@
+import io
+import json
+import os
+import pickle
+import socket
+import threading
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+
+from estado.concurrency import bounded_map, chunked, initialize_worker
+from estado.concurrency import run_chunk, run_shared_chunk
+from estado.concurrency import run_shared_worker_chunk, run_worker_chunk
+from estado.concurrency import runs_chunks_of, ship_machine
+from estado.execution import Execution
+from estado.hash_utils import fingerprint
+from estado.plan import Plan
+from estado.state_map import StateMap
 
 
 class Machine:
@@ -6,26 +24,174 @@ class Machine:
     """
 
     def __init__(self):
-        self.states = OrderedDict()
-        self.result = None
+        self.states = StateMap()
+        self._local = threading.local()
+
+        # An estado.profiling.Profiler reporting on interpretations
+        self.profiler = None
+
+        # An estado.checkpoint.CheckpointLog recording executions
+        self.checkpoint = None
+
+        # Whether plans fuse chains of Pass states into single steps
+        self._optimize = False
+
+        # Compilation cache. Each registered state owns an entry in
+        # _fragments holding the output of its compile method (None until
+        # first compiled); _dirty holds the names whose entry is stale.
+        self._compiled = None
+        self._fragments = OrderedDict()
+        self._dirty = set()
+        self._plan = None
+        self._fingerprint = None
+
+        # Validation index, maintained by validate for the states changed
+        # since it last ran, held in _unvalidated: the transitions of each
+        # state, the one state each state other than a Choice state goes
+        # on to unless it fails, the number of transitions to each name,
+        # the names transitioned to which are not registered, the
+        # machines of states such as Map states, and the problems of each
+        # state on its own.
+        self._transitions = {}
+        self._successors = {}
+        self._referrers = {}
+        self._missing = set()
+        self._nested = {}
+        self._problems = {}
+        self._unvalidated = set()
+        self._validated = False
+
+        # The graph checks are extended from the states changed since they
+        # last ran, as transitions added can only make more states
+        # reachable and add cycles: _reached holds the states reachable
+        # from the start state, or None when a transition was removed and
+        # the graph is walked in full again, and _cycles the cycles found.
+        self._reached = None
+        self._cycles = []
+
+    @property
+    def result(self):
+        """ The output of the last execution interpreted by the calling
+            thread. Executions keep their own data while running, so a
+            machine can be interpreted by many threads at once.
+        """
+        return getattr(self._local, "result", None)
+
+
+    @result.setter
+    def result(self, result):
+        self._local.result = result
+
+
+    @property
+    def optimize(self):
+        return self._optimize
+
+
+    @optimize.setter
+    def optimize(self, optimize):
+        self._optimize = optimize
+        self._plan = None
+
 
     def compile(self):
-        """ Incrementally build a compiled state machine by calling
-            the compile method of each state.
+        """ Build a compiled state machine by calling the compile method
+            of each state.
+
+            The compiled document is cached on the machine, and only the
+            states touched by register since the last call are recompiled.
+            The returned document is shared between calls and should not
+            be mutated.
         """
-        
-        compiled = {
+        if self._compiled is not None and not self._dirty:
+            return self._compiled
+
+        for name in self._dirty:
+            self._fragments[name] = self.states.peek(name).compile()
+        self._dirty.clear()
+
+        states = {}
+        for fragment in self._fragments.values():
+            states.update(fragment)
+
+        self._compiled = {
             "StartAt": self.start_at(),
-            "States": {}
+            "States": states
         }
 
-        for state in self.states:
-            compiled['States'] = {
-                **compiled['States'],
-                **self.states[state].compile()
-            }
+        return self._compiled
+
+    def compile_to(self, stream, buffer_size=65536):
+        """ Write the compiled state machine to a stream as JSON, one state
+            at a time, producing the same output as json.dumps(compile()).
+
+            The stream may be a text file, a binary file or a socket, which
+            are written UTF-8 encoded bytes. Output is buffered up to about
+            buffer_size characters, and the compiled document is never held
+            in memory as a whole.
+        """
+        if isinstance(stream, socket.socket):
+            write = stream.sendall
+            binary = True
+        else:
+            write = stream.write
+            binary = isinstance(stream, (io.RawIOBase, io.BufferedIOBase))
+
+        buffer = []
+        buffered = 0
+
+        def emit(chunk):
+            nonlocal buffered
+            buffer.append(chunk)
+            buffered += len(chunk)
+
+            if buffered >= buffer_size:
+                flush()
+
+        def flush():
+            nonlocal buffered
+            chunk = "".join(buffer)
+            write(chunk.encode("utf-8") if binary else chunk)
+            buffer.clear()
+            buffered = 0
 
-        return compiled
+        dumps = json.dumps
+        emit(f'{{"StartAt": {dumps(self.start_at())}, "States": {{')
+
+        separator = ""
+        for name in self.states:
+            fragment = self._fragments.get(name)
+
+            if fragment is None or name in self._dirty:
+                fragment = self.states.peek(name).compile()
+
+            for state_name, compiled in fragment.items():
+                emit(f"{separator}{dumps(state_name)}: {dumps(compiled)}")
+                separator = ", "
+
+        emit("}}")
+        flush()
+
+
+    def invalidate(self, name=None):
+        """ Mark a state as needing recompilation. This is only required
+            when a registered state is modified directly rather than
+            through register. With no name, every state is invalidated.
+        """
+        self._plan = None
+        self._fingerprint = None
+        self._validated = False
+
+        if name is None:
+            self._dirty.update(self.states)
+            self._unvalidated.update(self.states)
+        elif name in self.states:
+            self._dirty.add(name)
+            self._unvalidated.add(name)
+        else:
+            raise OperationalError(
+                f"There is no state named {name}"
+            )
 
     def start_at(self):
         """ Obtain the name of the first state in the machine
@@ -50,43 +216,504 @@ class Machine:
         ]
 
 
-    def register(self, state, force=False):
+    def register(self, state, force=False, link=True):
         """ Add a state to the state machine. If a state is added 
             sharing a name with a previously registered state, then 
-            an exception will be raised.
+            an exception will be raised, unless force is set, in which
+            case the new state takes the place and transitions of the
+            previously registered one.
 
             This function sets the next and end properties
-            of the states registered. 
+            of the states registered, unless link is False, in which
+            case the next and end properties of the state are kept.
+        """
+        self.extend((state,), force=force, link=link)
+
 
-            TODO: Support manual configuration of state order properties
+    def extend(self, states, force=False, link=True):
+        """ Register each state of an iterable, in order, in a single pass.
+            Each state is linked to the one registered before it, and the
+            last state becomes the terminal state of the machine, unless
+            link is False. The iterable may be a generator.
         """
+        registered = self.states
+        fragments = self._fragments
+        dirty = self._dirty
+        unvalidated = self._unvalidated
+        self._plan = None
+        self._fingerprint = None
+        self._validated = False
 
-        if state.name in self.states and not force:
-            raise OperationalError(
-                f"There is already a state named {state.name}" \
+        for state in states:
+            name = state.name
+
+            if name in registered:
+                if not force:
+                    raise OperationalError(
+                        f"There is already a state named {name}" \
+                    )
+
+                replaced = registered[name]
+                state.next = replaced.next
+                state.end = replaced.end
+
+                registered[name] = state
+                dirty.add(name)
+                unvalidated.add(name)
+                continue
+
+            if link:
+                if registered:
+                    tail = registered[next(reversed(registered))]
+                    tail.next = name
+                    tail.end = False
+                    dirty.add(tail.name)
+                    unvalidated.add(tail.name)
+
+                state.end = True
+                state.next = "End"
+
+            registered[name] = state
+            fragments.setdefault(name, None)
+            dirty.add(name)
+            unvalidated.add(name)
+
+
+    def validate(self):
+        """ Check that the machine can be interpreted: each state is valid
+            on its own, every state transitioned to exists, every state is
+            reachable from the start state, and the machine has no cycle
+            which no Choice state can leave. The machines of Map and
+            Parallel states are validated as well. Raises an
+            InvalidMachineException listing the problems found.
+
+            Only the states registered or invalidated since the last call
+            are checked on their own, and the checks of the machine as a
+            whole are extended from them, unless a transition was removed,
+            in which case they take time linear in its number of states, so
+            a machine can be validated after each edit. The states of a valid
+            machine are not checked again until it is modified, while its
+            nested machines, which may be modified on their own, are
+            validated on each call, each checking only its own changes.
+        """
+        found = [] if self._validated else self._check_states()
+        self._validated = not found
+
+        for name, machines in self._nested.items():
+            for machine in machines:
+                try:
+                    machine.validate()
+                except InvalidMachineException as error:
+                    found.append(
+                        f"State {name} has an invalid machine: {error}"
+                    )
+
+        if found:
+            raise InvalidMachineException(found)
+
+
+    def _check_states(self):
+        """ The problems of the states registered or invalidated since the
+            last validation, and of the graph of states as a whole
+        """
+        states = self.states
+        transitions = self._transitions
+        referrers = self._referrers
+        successors = self._successors
+        nested = self._nested
+        missing = self._missing
+        problems = self._problems
+        peek = states.peek
+        extended = []
+
+        for name in self._unvalidated:
+            state = peek(name)
+            previous = transitions.get(name, ())
+
+            for target in previous:
+                referrers[target] -= 1
+                if not referrers[target]:
+                    del referrers[target]
+                    missing.discard(target)
+
+            targets = transitions[name] = state.transitions()
+
+            for target in targets:
+                referrers[target] = referrers.get(target, 0) + 1
+                if target not in states:
+                    missing.add(target)
+
+            # A state transitioned to before it was registered may make
+            # states reachable from its referrers
+            if name in missing or not set(previous).issubset(targets):
+                self._reached = None
+            missing.discard(name)
+
+            if state.type == "Choice" or state.terminal():
+                successor = None
+            else:
+                successor = state.next
+
+            if successors.get(name) is None:
+                if successor is not None:
+                    extended.append(name)
+            elif successors[name] != successor:
+                self._reached = None
+            successors[name] = successor
+
+            machines = state.machines()
+            if machines:
+                nested[name] = machines
+            else:
+                nested.pop(name, None)
+
+            try:
+                state.validate()
+            except Exception as error:
+                problems[name] = f"State {name} is invalid: {error}"
+            else:
+                problems.pop(name, None)
+
+        changed = list(self._unvalidated)
+        self._unvalidated.clear()
+
+        found = list(problems.values())
+
+        if missing:
+            for name, targets in transitions.items():
+                for target in targets:
+                    if target in missing:
+                        found.append(
+                            f"State {name} transitions to unknown state " \
+                            f"{target}"
+                        )
+
+        if not states:
+            found.append("The machine has no states")
+        else:
+            found.extend(self._check_graph(changed, extended))
+
+        return found
+
+
+    def _check_graph(self, changed, extended):
+        """ The problems of the graph of states as a whole, found from the
+            states whose transitions changed, and the states whose
+            successor was set, or in time linear in the number of states
+            and transitions when the graph is walked in full
+        """
+        states = self.states
+        transitions = self._transitions
+        successors = self._successors
+        problems = []
+
+        start = self.start_at()
+        reached = self._reached
+
+        if reached is None:
+            reached = self._reached = {start}
+            pending = [start]
+            cycles = self._cycles = []
+            walks = states
+            fresh = None
+        else:
+            pending = [name for name in changed if name in reached]
+            cycles = self._cycles
+            walks = extended
+            fresh = set(extended)
+
+        while pending:
+            for target in transitions.get(pending.pop(), ()):
+                if target not in reached and target in states:
+                    reached.add(target)
+                    pending.append(target)
+
+        if len(reached) < len(states):
+            unreachable = [name for name in states if name not in reached]
+            problems.append(
+                f"Not reachable from the start state {start}: " \
+                f"{', '.join(unreachable)}"
             )
 
-        if self.states:
-            self.states[self.end_at()].next = state.name
-            self.states[self.end_at()].end = False
+        # Each state other than a Choice state transitions to at most one
+        # state unless it fails, so the cycles which cannot be left are
+        # found by walking from each state once, marking the states walked
+        # with the state the walk started from. Once the graph was walked,
+        # a new cycle goes through a state whose successor was set, so only
+        # the walks from those states are made, and the cycles they find
+        # which do not go through them were found already.
+        walked = {}
+
+        for name in walks:
+            node = name
+            path = []
+
+            while node is not None and node not in walked:
+                walked[node] = name
+                path.append(node)
+                node = successors.get(node)
+
+            if node is not None and walked[node] == name:
+                cycle = path[path.index(node):]
+                if fresh is None or not fresh.isdisjoint(cycle):
+                    cycles.append(
+                        f"Cycle without a Choice state: " \
+                        f"{' -> '.join(cycle)} -> {node}"
+                    )
+
+        problems.extend(cycles)
+
+        return problems
+
+
+    @classmethod
+    def from_states(cls, states):
+        """ Build a machine from an iterable of states, linked in the
+            order in which they are produced.
+        """
+        machine = cls()
+        machine.extend(states)
+        return machine
+
+
+    @classmethod
+    def from_asl(cls, document_or_path, registry=None, lazy=False,
+                 pass_result_paths=False):
+        """ Build a machine from an Amazon States Language document, given
+            as a dictionary, a file object or the path of a JSON file.
+
+            Task resources, such as "registry:add_two", are resolved against
+            the registry given, or an iterable of registries, by name. With
+            lazy set, each state is only built when it is first looked up
+            in the states of the machine or interpreted, so that loading a
+            large document is cheap when only part of it is executed.
+
+            A Pass state with a Result outputs its input, when not empty,
+            rather than placing the Result at its ResultPath. With
+            pass_result_paths set, Pass states follow the Amazon States
+            Language instead, and place their result, or their input when
+            they have none, at their ResultPath, $ by default.
+        """
+        from estado.asl import load_machine
+
+        return load_machine(
+            document_or_path,
+            registry=registry,
+            lazy=lazy,
+            machine_class=cls,
+            pass_result_paths=pass_result_paths
+        )
+
+
+    def fingerprint(self):
+        """ Obtain a digest of the structure of the machine, computed from
+            the compiled form of its states, so that equal machines have
+            the same fingerprint whichever process built them. Generated
+            names, such as those of unnamed states, do not change the
+            fingerprint. It is cached until the machine is modified.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.compile())
+        return self._fingerprint
+
+
+    def plan(self, layout=None):
+        """ Obtain the execution plan of the machine. The plan is cached
+            until the machine is modified through register, extend or
+            invalidate. A layout, as returned by Plan.layout, spares
+            resolving the transitions of the plan when it is built.
+
+            When the optimize attribute of the machine is set, chains of
+            Pass states are interpreted as a single step, named after the
+            first state of the chain; the names of the states of each
+            chain are in the fused attribute of the plan. The states of
+            the machine, and so its compiled form, are left as they are.
+        """
+        if self._plan is None:
+            self._plan = Plan(self, layout, optimize=self.optimize)
+        return self._plan
+
+
+    def asynchronous(self):
+        """ Whether interpreting a state of the machine, or of its nested
+            machines, awaits a coroutine function. It is found without
+            building deferred states, and cached with the plan.
+        """
+        plan = self.plan()
+
+        if plan.asynchronous is None:
+            peek = self.states.peek
+            plan.asynchronous = any(
+                peek(name).asynchronous() for name in plan.names
+            )
+
+        return plan.asynchronous
+
+
+    def execute(self, input=None, id=None):
+        """ Run an execution of the machine, returning the Execution, which
+            holds the output along with its timing.
+
+            When the machine has a checkpoint log, each transition of the
+            execution is recorded under its id, which is generated unless
+            given, so that it can be resumed if interrupted.
+        """
+        execution = Execution(
+            self.plan(), input, self.profiler, id, self.checkpoint
+        )
+        execution.run()
+        return execution
+
 
-        state.end = True
-        state.next = "End"
+    def resume(self, execution_id):
+        """ Continue an execution from the last transition recorded in the
+            checkpoint log of the machine, without interpreting the states
+            it already completed, and return the Execution.
+        """
+        if self.checkpoint is None:
+            raise OperationalError(
+                "Executions can only be resumed from a checkpoint log"
+            )
 
-        self.states[state.name] = state
+        execution = Execution.resume(
+            self.plan(), self.checkpoint, execution_id, self.profiler
+        )
+        execution.run()
+        return execution
 
 
     def interpret(self, input=None):
-        """ A naive interpretation function that simply passes the result 
-            of the last state to the next state.
+        """ Interpret the machine from its start state, following the next
+            property of each state and passing the output of each state as
+            the input of the next.
         """
-        for state in self.states:
-            # TODO: This call should take an input rather than result object
-            self.result = self.states[state].interpret(input=input)
-            input = self.result
+        # TODO: States should take an input rather than result object
+        self.result = self.execute(input).output
         return self.result
 
 
+    async def execute_async(self, input=None, id=None):
+        """ Run an execution of the machine from a coroutine, returning the
+            Execution.
+        """
+        execution = Execution(
+            self.plan(), input, self.profiler, id, self.checkpoint
+        )
+        await execution.run_async()
+        return execution
+
+
+    async def interpret_async(self, input=None):
+        """ Interpret the machine from a coroutine. Task states invoke
+            their resources without blocking the event loop, so many
+            executions can be interleaved, for instance with asyncio.gather.
+        """
+        self.result = (await self.execute_async(input)).output
+        return self.result
+
+
+    def interpret_many(self, inputs, workers=None, ordered=True,
+                       window=None, chunksize=1, processes=False,
+                       initializer=None, initargs=(), executor=None):
+        """ Interpret the machine once for each input of an iterable,
+            lazily yielding the result of each execution. The inputs may
+            be a generator, and are consumed only as results are requested.
+
+            With workers set, inputs are split into chunks of chunksize
+            and run on a pool of that many threads, or processes if
+            processes is set, with at most window chunks (by default twice
+            the number of workers) in flight at once. Results are yielded
+            in input order unless ordered is False, in which case each
+            chunk is yielded as it completes.
+
+            Worker processes receive a pickled copy of the machine once,
+            when they start, so the resources of its registries must be
+            importable by name. initializer is called with initargs in
+            each worker once the machine is loaded, and can be used to
+            warm up expensive resources.
+
+            With an executor given, chunks run on it rather than on a pool
+            made for the call, and it is not shut down, so that it can be
+            shared between calls; workers then only sizes the window, and
+            initializer is not used. Called on a worker of that executor,
+            as by a nested Map state, the inputs are interpreted on the
+            calling thread. It must be a process pool if processes is set,
+            in which case the pickled machine is written to a temporary
+            file once, and loaded from it once by each worker process.
+
+            Executions in worker processes are not reported to the
+            profiler of the machine. Unlike interpret, this does not set
+            the result of the machine.
+        """
+        run = partial(
+            self.plan().run,
+            profiler=self.profiler,
+            checkpoint=self.checkpoint
+        )
+
+        # A worker of the executor waiting for chunks queued behind the one
+        # it runs may wait forever, so nested calls run their inputs inline
+        if executor is not None and runs_chunks_of(executor):
+            executor = workers = None
+
+        shipped = None
+
+        if executor is not None:
+            pool = nullcontext(executor)
+
+            if processes:
+                digest, shipped = ship_machine(self)
+                run = partial(run_shared_worker_chunk, digest, shipped)
+            else:
+                run = partial(run_shared_chunk, executor, run)
+        elif not workers:
+            for input in inputs:
+                yield run(input)
+            return
+        elif processes:
+            executor = pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=initialize_worker,
+                initargs=(pickle.dumps(self), initializer, initargs)
+            )
+            run = run_worker_chunk
+        else:
+            executor = pool = ThreadPoolExecutor(
+                max_workers=workers,
+                initializer=initializer,
+                initargs=initargs
+            )
+            run = partial(run_chunk, run)
+
+        try:
+            with pool:
+                for results in bounded_map(
+                        run, chunked(inputs, chunksize), executor,
+                        window or 2 * (workers or 1),
+                        ordered=ordered
+                ):
+                    yield from results
+        finally:
+            if shipped is not None:
+                os.unlink(shipped)
+
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state["_plan"] = None
+        state["profiler"] = None
+        del state["_local"]
+
+        return state
+
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
     def __add__(self, other):
         """ Syntactic sugar allowing
               - A state to be registered using the + operator.
@@ -106,8 +733,7 @@ class Machine:
             self.register(other)
 
         elif isinstance(other, Machine):
-            for state in other.states:
-                self += other.states[state]
+            self.extend(other.states.values())
 
         return self
 
@@ -117,4 +743,11 @@ class OperationalError(Exception):
     def __init__(self, message):
         Exception.__init__(self, message)
 
+
+class InvalidMachineException(OperationalError):
+
+    def __init__(self, problems):
+        self.problems = problems
+        OperationalError.__init__(self, "; ".join(problems))
+
         
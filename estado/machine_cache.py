@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+
+
+class MachineCache:
+    """ A cache of compiled machines in a directory, addressed by their
+        fingerprint, holding the Amazon States Language document and the
+        layout of the plan of each machine, so that a machine built once
+        can be loaded by other processes rather than built again.
+
+        Entries are written atomically, and never modified, so any number
+        of processes may share a directory.
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, fingerprint):
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+
+    def __contains__(self, fingerprint):
+        return os.path.exists(self.path(fingerprint))
+
+
+    def put(self, machine):
+        """ Store a machine, unless a machine of the same structure is
+            stored already, and return its fingerprint
+        """
+        fingerprint = machine.fingerprint()
+        path = self.path(fingerprint)
+
+        if os.path.exists(path):
+            return fingerprint
+
+        entry = {
+            "fingerprint": fingerprint,
+            "document": machine.compile(),
+            "plan": machine.plan().layout()
+        }
+
+        descriptor, temporary = tempfile.mkstemp(
+            dir=self.directory, suffix=".tmp"
+        )
+
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(entry, file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        return fingerprint
+
+
+    def get(self, fingerprint, registry=None, lazy=True, machine_class=None,
+            pass_result_paths=False):
+        """ Load the machine stored under a fingerprint, or None. Its Task
+            resources are resolved against the registries given, by name,
+            and with lazy set its states are only built when first used.
+            Pass states place their result at their ResultPath with
+            pass_result_paths set, as for Machine.from_asl.
+        """
+        if machine_class is None:
+            from estado.machine import Machine as machine_class
+
+        try:
+            with open(self.path(fingerprint)) as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+
+        machine = machine_class.from_asl(
+            entry["document"],
+            registry=registry,
+            lazy=lazy,
+            pass_result_paths=pass_result_paths
+        )
+        machine.plan(layout=entry["plan"])
+
+        return machine
+
+
+    def __repr__(self):
+        return f"<MachineCache:{self.directory}>"
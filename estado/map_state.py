@@ -0,0 +1,170 @@
+import asyncio
+import os
+
+from estado.input import Input
+from estado.paths import MISSING, compile_path, definition_paths, document
+from estado.result import Result
+from estado.state import State
+
+
+class Map(State):
+    """ A state interpreting a machine, the iterator, once for each item of
+        a list found at items_path in its input, and resulting in the list
+        of outputs, in the order of the items.
+
+        Up to max_concurrency items are interpreted at once, on threads, or
+        on processes if processes is set, with no limit other than the size
+        of the pool when it is 0. Items are sent to workers in chunks of
+        chunk_size items, by default sized so that each worker is sent
+        about four chunks.
+
+        The pool is made for each interpretation, unless an executor is
+        given, on which the chunks then run. A Map state interpreted by a
+        worker of its executor, such as one nested in another Map state
+        with the same executor, interprets its items on that worker. It
+        must be a process pool if processes is set, and is not pickled
+        with the state.
+    """
+
+    __slots__ = (
+        "iterator", "items_path", "max_concurrency", "chunk_size",
+        "processes", "executor"
+    )
+
+    _transient_slots = ("executor",)
+
+    def __init__(self, iterator, items_path="$", max_concurrency=0,
+                 name="", next=None, end=False, chunk_size=None,
+                 processes=False, input_path=None, result_path=None,
+                 output_path=None, executor=None):
+
+        state_config = {
+            "name": name,
+            "type": "Map",
+            "next": next,
+            "end": end,
+            "input_path": input_path,
+            "result_path": result_path,
+            "output_path": output_path
+        }
+
+        State.__init__(self, state_config)
+
+        self.iterator = iterator
+        self.items_path = items_path
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.executor = executor
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Map state from its Amazon States Language definition
+        """
+        from estado.machine import Machine
+
+        return cls(
+            Machine.from_asl(
+                definition["Iterator"],
+                registry=list(registries.values()),
+                pass_result_paths=pass_result_paths
+            ),
+            items_path=definition.get("ItemsPath", "$"),
+            max_concurrency=definition.get("MaxConcurrency", 0),
+            name=name,
+            next=definition.get("Next"),
+            end=definition.get("End", False),
+            **definition_paths(definition, pass_result_paths)
+        )
+
+
+    def machines(self):
+        return (self.iterator,)
+
+
+    def asynchronous(self):
+        return self.iterator.asynchronous()
+
+
+    def items(self, input):
+        """ Obtain the items of an input as inputs of the iterator
+        """
+        items = compile_path(self.items_path)(input)
+
+        if items is MISSING or not isinstance(items, list):
+            raise MapItemsException(self.name, self.items_path)
+
+        return [self.normalize_result_or_input(item, Input) for item in items]
+
+
+    def workers(self, count):
+        """ The number of workers interpreting count items
+        """
+        if self.max_concurrency == 1 or count <= 1:
+            return None
+
+        if self.max_concurrency:
+            return min(self.max_concurrency, count)
+
+        return min(count, 32, (os.cpu_count() or 1) + 4)
+
+
+    def interpret(self, input=None):
+
+        items = self.items(input)
+        workers = self.workers(len(items))
+
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            chunk_size = max(1, len(items) // (4 * (workers or 1)))
+
+        # At most one chunk per worker is in flight on a shared executor
+        executor = self.executor if workers else None
+
+        outputs = self.iterator.interpret_many(
+            items,
+            workers=workers,
+            window=workers if executor is not None else None,
+            chunksize=chunk_size,
+            processes=self.processes,
+            executor=executor
+        )
+
+        return Result([document(output) for output in outputs])
+
+
+    async def interpret_async(self, input=None):
+
+        items = self.items(input)
+        semaphore = asyncio.Semaphore(self.max_concurrency or len(items) or 1)
+
+        async def interpret_item(item):
+            async with semaphore:
+                return await self.iterator.interpret_async(input=item)
+
+        outputs = await asyncio.gather(*map(interpret_item, items))
+
+        return Result([document(output) for output in outputs])
+
+
+    def compile(self):
+
+        compiled = {
+            **self.compile_(),
+            "ItemsPath": self.items_path,
+            "MaxConcurrency": self.max_concurrency,
+            "Iterator": self.iterator.compile()
+        }
+
+        return {
+            self.name: compiled
+        }
+
+
+class MapItemsException(Exception):
+
+    def __init__(self, name, items_path):
+        message = f"The input of Map state {name} has no list of items " \
+            f"at {items_path}"
+        Exception.__init__(self, message)
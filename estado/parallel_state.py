@@ -0,0 +1,110 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from estado.paths import definition_paths, document
+from estado.result import Result
+from estado.state import State
+
+
+class Parallel(State):
+    """ A state interpreting several machines, its branches, on the same
+        input at once, and resulting in the list of their outputs, in the
+        order of the branches.
+
+        Branches are interpreted on threads, the first on the calling
+        thread, unless one of their Task states invokes a coroutine
+        function, in which case all are interpreted on an event loop.
+    """
+
+    __slots__ = ("branches",)
+
+    def __init__(self, branches=(), name="", next=None, end=False,
+                 input_path=None, result_path=None, output_path=None):
+
+        state_config = {
+            "name": name,
+            "type": "Parallel",
+            "next": next,
+            "end": end,
+            "input_path": input_path,
+            "result_path": result_path,
+            "output_path": output_path
+        }
+
+        State.__init__(self, state_config)
+
+        self.branches = list(branches)
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Parallel state from its Amazon States Language definition
+        """
+        from estado.machine import Machine
+
+        return cls(
+            branches=[
+                Machine.from_asl(
+                    branch,
+                    registry=list(registries.values()),
+                    pass_result_paths=pass_result_paths
+                )
+                for branch in definition["Branches"]
+            ],
+            name=name,
+            next=definition.get("Next"),
+            end=definition.get("End", False),
+            **definition_paths(definition, pass_result_paths)
+        )
+
+
+    def machines(self):
+        return tuple(self.branches)
+
+
+    def asynchronous(self):
+        return any(branch.asynchronous() for branch in self.branches)
+
+
+    def interpret(self, input=None):
+
+        if not self.branches:
+            return Result([])
+
+        if self.asynchronous():
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.interpret_async(input=input))
+
+        first, *others = self.branches
+
+        with ThreadPoolExecutor(max_workers=max(1, len(others))) as executor:
+            futures = [
+                executor.submit(branch.interpret, input) for branch in others
+            ]
+            outputs = [first.interpret(input=input)]
+            outputs.extend(future.result() for future in futures)
+
+        return Result([document(output) for output in outputs])
+
+
+    async def interpret_async(self, input=None):
+
+        outputs = await asyncio.gather(*(
+            branch.interpret_async(input=input) for branch in self.branches
+        ))
+
+        return Result([document(output) for output in outputs])
+
+
+    def compile(self):
+
+        compiled = {
+            **self.compile_(),
+            "Branches": [branch.compile() for branch in self.branches]
+        }
+
+        return {
+            self.name: compiled
+        }
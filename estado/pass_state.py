@@ -1,10 +1,15 @@
+from estado.paths import definition_paths
+from estado.result import Result
 from estado.state import State
 
 
 class Pass(State):
 
+    __slots__ = ()
+
     def __init__(self, result=None, name="",
-                 next=None, end=False, **input):
+                 next=None, end=False, input_path=None,
+                 result_path=None, output_path=None, **input):
 
         state_config = {
             "name": name,
@@ -12,16 +17,60 @@ class Pass(State):
             "next": next,
             "input": input,
             "result": result,
-            "end": end
+            "end": end,
+            "input_path": input_path,
+            "result_path": result_path,
+            "output_path": output_path
         }
             
         State.__init__(self, state_config)
 
-        if not self.result:
-            self.result.results = self.input.inputs
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Pass state from its Amazon States Language definition
+        """
+        result = definition.get("Result")
+
+        if result is not None:
+            path = definition.get("ResultPath", "$.result")
+
+            if isinstance(result, dict):
+                # The fields are not passed as keyword arguments, which
+                # would clash with those of Result
+                fields = result
+                result = Result(path=path)
+                result.results = dict(fields)
+            else:
+                result = Result(result, path=path)
+
+        return cls(
+            result=result,
+            name=name,
+            next=definition.get("Next"),
+            end=definition.get("End", False),
+            **definition_paths(definition, pass_result_paths)
+        )
+
+
+    def materialize_result(self, result):
+        """ Without a result, a Pass state results in its input
+        """
+        result = State.materialize_result(self, result)
+
+        if not result:
+            result.results = self.input.inputs
+
+        return result
 
 
     def interpret(self, input=None):
+        # With a result path, the data flow of the state places its result,
+        # or its input when it has none, at that path
+        if self.result_path is not None:
+            return input if self._result is None else self.result
+
         if input:
             return input
         else:
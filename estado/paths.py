@@ -0,0 +1,272 @@
+import re
+from functools import lru_cache
+
+from estado.input import Input
+from estado.result import Result
+
+# Returned by path getters when the path does not exist in the data
+MISSING = object()
+
+# The ResultPath of states discarding their result, null in JSON
+DISCARD = object()
+
+_TOKEN = re.compile(
+    r"""\.(?P<name>[^.\[\]]+)"""
+    r"""|\[(?P<index>\d+)\]"""
+    r"""|\[(?P<quote>['"])(?P<key>.*?)(?P=quote)\]"""
+)
+
+
+class InvalidPathException(Exception):
+
+    def __init__(self, path):
+        message = f"Invalid path {path}, paths should start with $ " \
+            f"followed by .field, ['field'] or [index] selectors"
+        Exception.__init__(self, message)
+
+
+class PathNotFoundException(Exception):
+
+    def __init__(self, name, path):
+        message = f"The data of state {name} has no value at {path}"
+        Exception.__init__(self, message)
+
+
+def document(data):
+    """ The JSON document standing for the data passed between states
+    """
+    if isinstance(data, Input):
+        return data.inputs
+    if isinstance(data, Result):
+        return data.results
+    return data
+
+
+def parse_path(path):
+    """ Split a path such as $.a['b'][0] into its keys, ('a', 'b', 0)
+    """
+    if not path.startswith("$"):
+        raise InvalidPathException(path)
+
+    keys = []
+    position = 1
+
+    while position < len(path):
+        token = _TOKEN.match(path, position)
+
+        if token is None:
+            raise InvalidPathException(path)
+
+        if token.group("name") is not None:
+            keys.append(token.group("name"))
+        elif token.group("index") is not None:
+            keys.append(int(token.group("index")))
+        else:
+            keys.append(token.group("key"))
+
+        position = token.end()
+
+    return tuple(keys)
+
+
+@lru_cache(maxsize=None)
+def compile_path(path):
+    """ Obtain a function returning the value at a path of the data passed
+        between states, or MISSING. Paths are parsed once, however many
+        times they are compiled.
+    """
+    keys = parse_path(path)
+
+    if not keys:
+        return document
+
+    if len(keys) == 1:
+        key, = keys
+
+        def get(data):
+            data = document(data)
+            try:
+                return data[key]
+            except (KeyError, IndexError, TypeError):
+                return MISSING
+
+        return get
+
+    def get(data):
+        data = document(data)
+        try:
+            for key in keys:
+                data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return MISSING
+        return data
+
+    return get
+
+
+def assign(data, keys, value):
+    """ A copy of data with the value at keys replaced, sharing the parts
+        of data off the path rather than copying them. Missing objects on
+        the path are created, and LookupError is raised when a key does
+        not fit the data, being a field of a value which is not an object
+        or an index out of the range of a list.
+    """
+    if not keys:
+        return value
+
+    key, *rest = keys
+
+    if isinstance(key, int):
+        if not isinstance(data, list) or key >= len(data):
+            raise LookupError(key)
+        container = list(data)
+        container[key] = assign(container[key], rest, value)
+    elif data is None:
+        container = {key: assign(None, rest, value)}
+    elif isinstance(data, dict):
+        container = dict(data)
+        container[key] = assign(container.get(key), rest, value)
+    else:
+        raise LookupError(key)
+
+    return container
+
+
+@lru_cache(maxsize=None)
+def compile_setter(path):
+    """ Obtain a function returning a copy of the data passed between
+        states, as a JSON document, with the value at a path replaced. It
+        raises PathNotFoundException, naming the state it is given, when
+        the path does not fit the data.
+    """
+    keys = parse_path(path)
+
+    def set_(data, value, name):
+        try:
+            return assign(document(data), keys, value)
+        except LookupError:
+            raise PathNotFoundException(name, path) from None
+
+    return set_
+
+
+def result_document(result):
+    """ The JSON document standing for the result of a state, which for a
+        Result holding a single value, such as the return value of a Task
+        resource, is that value
+    """
+    if isinstance(result, Result):
+        results = result.results
+        if len(results) == 1 and "result" in results:
+            return results["result"]
+        return results
+    return document(result)
+
+
+def as_input(data):
+    """ The Input passing a JSON document to a state
+    """
+    if isinstance(data, dict):
+        return Input(**data)
+    return Input(input=data)
+
+
+def definition_paths(definition, pass_result_paths=False):
+    """ The input_path, result_path and output_path arguments of a state
+        from its Amazon States Language definition. The ResultPath of a
+        Pass state is the path of its Result instead, unless
+        pass_result_paths is set, in which case it defaults to $.
+    """
+    paths = {
+        "input_path": definition.get("InputPath"),
+        "output_path": definition.get("OutputPath")
+    }
+
+    if definition["Type"] == "Pass":
+        if not pass_result_paths:
+            return paths
+        result_path = definition.get("ResultPath", "$")
+    elif "ResultPath" in definition:
+        result_path = definition["ResultPath"]
+    else:
+        return paths
+
+    paths["result_path"] = DISCARD if result_path is None else result_path
+
+    return paths
+
+
+def flow_paths(input_path=None, result_path=None, output_path=None):
+    """ The input, result and output paths of a state, defaulting to $, or
+        None when none is set and its data is passed as it is
+    """
+    paths = (input_path, result_path, output_path)
+
+    if all(path is None for path in paths):
+        return None
+
+    return tuple("$" if path is None else path for path in paths)
+
+
+def compile_flow(name, input_path, result_path, output_path):
+    """ Compile the paths of a state into functions applied around its
+        interpret method: one obtaining the input of the state from the
+        data it is given, and one obtaining the data passed on from the
+        data it was given and its result.
+
+        The result is set into a copy of the data it was given, in which
+        only the dictionaries and lists on the path are copied, and the
+        rest is shared, so that large data is never copied as a whole.
+    """
+    get_input = compile_path(input_path)
+    get_output = compile_path(output_path)
+    set_result = None if result_path is DISCARD else \
+        compile_setter(result_path)
+
+    def before(data):
+        selected = get_input(data)
+        if selected is MISSING:
+            raise PathNotFoundException(name, input_path)
+        return as_input(selected)
+
+    def after(data, result):
+        data = document(data)
+
+        if set_result is not None:
+            data = set_result(data, result_document(result), name)
+
+        output = get_output(data)
+        if output is MISSING:
+            raise PathNotFoundException(name, output_path)
+        return as_input(output)
+
+    return before, after
+
+
+def apply_flow(name, interpret, interpret_async, paths):
+    """ Wrap the interpret and interpret_async methods of a state with the
+        functions compiled from its paths, given as returned by its
+        data_flow method
+    """
+    before, after = compile_flow(name, *paths)
+
+    def interpret_with_paths(input=None):
+        return after(input, interpret(input=before(input)))
+
+    async def interpret_async_with_paths(input=None):
+        return after(input, await interpret_async(input=before(input)))
+
+    return interpret_with_paths, interpret_async_with_paths
+
+
+def apply_router_flow(name, router, paths):
+    """ Wrap the router of a state, which is given the data the state was
+        given, so that it routes on the input the state interprets, as
+        selected by its InputPath, rather than on its output
+    """
+    before, _ = compile_flow(name, *paths)
+
+    def route(input=None):
+        return router(before(input))
+
+    return route
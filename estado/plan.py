@@ -0,0 +1,231 @@
+from estado.execution import ROUTED, TERMINAL, Execution
+from estado.paths import apply_flow, apply_router_flow
+
+
+class Plan:
+    """ A flat lowering of a state machine used by the interpreter.
+
+        States are addressed by their position in the machine. For each
+        position the plan holds the bound interpret and interpret_async
+        methods of the state, wrapped with its paths if it has any, and
+        the position of the state it transitions to, or TERMINAL. States
+        whose next state depends on their output, such as Choice states,
+        have the transition ROUTED, and a router mapping their output to
+        the position of the next state. Wait states also have a function
+        with which a Scheduler parks executions rather than interpreting
+        them, and states with Retry or Catch rules a recovery function,
+        called when they raise.
+    """
+
+    def __init__(self, machine, layout=None, optimize=False):
+        from estado.machine import OperationalError
+
+        states = machine.states
+        names = tuple(states)
+        index = {name: position for position, name in enumerate(names)}
+
+        # A layout of a plan of other states is not used
+        if layout is not None and tuple(layout["names"]) != names:
+            layout = None
+
+        handlers = []
+        async_handlers = []
+        transitions = []
+        routers = []
+        waits = []
+        recoveries = []
+
+        # States are peeked at so that deferred states are not built
+        peek = states.peek
+
+        for position, name in enumerate(names):
+            state = peek(name)
+            paths = state.data_flow()
+
+            if paths is None:
+                handlers.append(state.interpret)
+                async_handlers.append(state.interpret_async)
+            else:
+                interpret, interpret_async = apply_flow(
+                    name, state.interpret, state.interpret_async, paths
+                )
+                handlers.append(interpret)
+                async_handlers.append(interpret_async)
+
+            router = state.router(index)
+            if router is not None and paths is not None:
+                router = apply_router_flow(name, router, paths)
+            routers.append(router)
+
+            waits.append(
+                states[name].parker(paths) if state.type == "Wait" else None
+            )
+            recoveries.append(state.recovery(index, position))
+
+            if router is not None:
+                transitions.append(ROUTED)
+            elif layout is not None:
+                transitions.append(layout["transitions"][position])
+            elif state.terminal():
+                transitions.append(TERMINAL)
+            elif state.next in index:
+                transitions.append(index[state.next])
+            else:
+                raise OperationalError(
+                    f"State {name} transitions to unknown state {state.next}"
+                )
+
+        self.names = names
+        self.index = index
+        self.handlers = tuple(handlers)
+        self.async_handlers = tuple(async_handlers)
+        self.transitions = tuple(transitions)
+        self.routers = tuple(routers)
+        self.waits = tuple(waits)
+        self.recoveries = tuple(recoveries)
+        self.start = index[machine.start_at()] if names else TERMINAL
+
+        # The transitions of the states themselves, which optimization
+        # leaves as they are, and the chains of Pass states fused into a
+        # single step, by the name of their first state
+        self.links = self.transitions
+        self.fused = {}
+
+        # Whether a state awaits a coroutine function, found by
+        # Machine.asynchronous when first needed
+        self.asynchronous = None
+
+        if optimize:
+            self._fuse_passes(states)
+
+
+    def _fuse_passes(self, states):
+        """ Replace each chain of two or more Pass states, each but the
+            first transitioned to only by the one before it, by a single
+            step at the position of the first state, transitioning to the
+            state following the last.
+
+            A Pass state outputs its input when it is not empty, and its
+            result otherwise, so the output of a chain is its input when
+            not empty, and otherwise the first result of the chain which is
+            not empty, or its last result, which is found once here. Pass
+            states with paths, or of subclasses, are left as they are.
+        """
+        from estado.pass_state import Pass
+
+        names = self.names
+        index = self.index
+        transitions = list(self.transitions)
+        handlers = list(self.handlers)
+        async_handlers = list(self.async_handlers)
+        peek = states.peek
+
+        # The number of transitions to each state, and the last state
+        # found transitioning to it
+        predecessors = [0] * len(names)
+        predecessor = [None] * len(names)
+
+        if names:
+            predecessors[self.start] += 1
+
+        for position, name in enumerate(names):
+            for target in peek(name).transitions():
+                if target in index:
+                    predecessors[index[target]] += 1
+                    predecessor[index[target]] = position
+
+        passes = {}
+
+        for position, name in enumerate(names):
+            if peek(name).type == "Pass":
+                state = states[name]
+                if state.__class__ is Pass and state.data_flow() is None:
+                    passes[position] = state
+
+        def follows_pass(position):
+            previous = predecessor[position]
+            return predecessors[position] == 1 and previous in passes and \
+                self.links[previous] == position
+
+        for head in passes:
+            if follows_pass(head):
+                continue
+
+            chain = [head]
+            chained = {head}
+            position = self.links[head]
+
+            while position in passes and follows_pass(position) and \
+                  position not in chained:
+                chain.append(position)
+                chained.add(position)
+                position = self.links[position]
+
+            if len(chain) < 2:
+                continue
+
+            results = [passes[position].result for position in chain]
+            constant = next((result for result in results if result),
+                            results[-1])
+
+            def interpret(input=None, constant=constant):
+                return input if input else constant
+
+            async def interpret_async(input=None, constant=constant):
+                return input if input else constant
+
+            handlers[head] = interpret
+            async_handlers[head] = interpret_async
+            transitions[head] = self.links[chain[-1]]
+            self.fused[names[head]] = tuple(
+                names[position] for position in chain
+            )
+
+        self.handlers = tuple(handlers)
+        self.async_handlers = tuple(async_handlers)
+        self.transitions = tuple(transitions)
+
+
+    def layout(self):
+        """ The names and transitions of the plan, as JSON, from which the
+            plan of a machine of the same states is built without resolving
+            its transitions
+        """
+        return {
+            "names": list(self.names),
+            "transitions": list(self.links)
+        }
+
+
+    def follow(self, position, output):
+        """ Obtain the position of the state following the state at a
+            position, given its output
+        """
+        transition = self.links[position]
+
+        if transition == ROUTED:
+            return self.routers[position](output)
+
+        return transition
+
+
+    def run(self, input=None, profiler=None, checkpoint=None):
+        """ Run a single execution from the start state, passing the output
+            of each state as the input of the state it transitions to.
+        """
+        return Execution(
+            self, input, profiler, checkpoint=checkpoint
+        ).run()
+
+
+    async def run_async(self, input=None, profiler=None, checkpoint=None):
+        """ Run a single execution from a coroutine, awaiting the
+            interpret_async method of each state.
+        """
+        return await Execution(
+            self, input, profiler, checkpoint=checkpoint
+        ).run_async()
+
+
+    def __repr__(self):
+        return f"<Plan:{len(self.names)} states>"
@@ -0,0 +1,138 @@
+import json
+from collections import deque, namedtuple
+from random import random
+from threading import Lock
+from time import perf_counter
+
+from estado.input import Input
+from estado.result import Result
+
+# A sampled record of the interpretation of a state, or of a chain of Pass
+# states fused into one step, named in fused, by an optimized plan
+TraceRecord = namedtuple(
+    "TraceRecord",
+    ["state", "duration", "input_size", "output_size", "fused"],
+    defaults=(None,)
+)
+
+
+def data_size(data):
+    """ The size of the data passed between states, as the length of its
+        JSON representation
+    """
+    if isinstance(data, Input):
+        data = data.inputs
+    elif isinstance(data, Result):
+        data = data.results
+
+    return len(json.dumps(data, default=repr))
+
+
+class StateStats:
+    """ Counters of the interpretations of a single state, with times in
+        seconds. The names of the chain of Pass states the state was fused
+        into by an optimized plan, if any, are in fused.
+    """
+
+    __slots__ = ("calls", "errors", "total_time", "max_time", "fused")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.fused = None
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+    def __repr__(self):
+        return f"<StateStats:{self.calls} calls|{self.total_time:.6f}s>"
+
+
+class Profiler:
+    """ Collects per state call counts and wall times from the interpreter.
+
+        before is called with the name and input of each state before it is
+        interpreted, and after with its name, input, output and duration.
+        A proportion sample_rate of interpretations is recorded as a
+        TraceRecord in traces, which keeps the latest max_traces records.
+
+        Profiling is enabled by setting the profiler of a machine, and
+        machines without a profiler do not pay for it.
+    """
+
+    def __init__(self, before=None, after=None, sample_rate=0.0,
+                 max_traces=10000, sizer=data_size, clock=perf_counter):
+
+        self.before = before
+        self.after = after
+        self.sample_rate = sample_rate
+        self.sizer = sizer
+        self.clock = clock
+
+        self.stats = {}
+        self.traces = deque(maxlen=max_traces)
+
+        self._lock = Lock()
+
+    def record(self, name, input, output, duration, failed=False,
+               fused=None):
+        """ Record the interpretation of a state. A chain of Pass states
+            fused into one step, whose names are given in fused, is
+            recorded under each of them, with an equal share of the
+            duration of the step.
+        """
+        names = fused or (name,)
+        share = duration / len(names)
+
+        with self._lock:
+            for state in names:
+                stats = self.stats.get(state)
+
+                if stats is None:
+                    stats = self.stats[state] = StateStats()
+
+                stats.fused = fused
+                stats.calls += 1
+                stats.total_time += share
+
+                if share > stats.max_time:
+                    stats.max_time = share
+
+                if failed:
+                    stats.errors += 1
+
+        if self.sample_rate and random() < self.sample_rate:
+            self.traces.append(TraceRecord(
+                name,
+                duration,
+                self.sizer(input),
+                None if failed else self.sizer(output),
+                fused
+            ))
+
+
+    def report(self):
+        """ Obtain the names and stats of the states interpreted, slowest
+            in total first
+        """
+        with self._lock:
+            return sorted(
+                self.stats.items(),
+                key=lambda item: item[1].total_time,
+                reverse=True
+            )
+
+
+    def reset(self):
+
+        with self._lock:
+            self.stats.clear()
+            self.traces.clear()
+
+
+    def __repr__(self):
+        return f"<Profiler:{len(self.stats)} states>"
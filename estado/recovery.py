@@ -0,0 +1,114 @@
+from estado.input import Input
+from estado.paths import compile_setter
+
+# Error names matching any exception raised by a state
+WILDCARD_ERRORS = {"States.ALL", "States.TaskFailed"}
+
+
+def error_name(error):
+    return type(error).__name__
+
+
+def matches(error_equals, error):
+    """ Whether an exception matches the ErrorEquals field of a Retry or
+        Catch rule, which names exception classes or their base classes
+    """
+    names = set(error_equals)
+
+    if names & WILDCARD_ERRORS:
+        return True
+
+    return any(class_.__name__ in names for class_ in type(error).__mro__)
+
+
+def retry_delay(retrier, attempt):
+    """ The number of seconds to wait before a retry, or None once the
+        attempts of the retrier are exhausted. Attempts count from 1.
+    """
+    if attempt > retrier.get("MaxAttempts", 3):
+        return None
+
+    delay = retrier.get("IntervalSeconds", 1) * \
+        retrier.get("BackoffRate", 2.0) ** (attempt - 1)
+
+    if "MaxDelaySeconds" in retrier:
+        delay = min(delay, retrier["MaxDelaySeconds"])
+
+    return delay
+
+
+def check_catchers(name, catch):
+    """ Raise InvalidCatcherException for the first Catch rule of a state
+        which has no Next state
+    """
+    for catcher in catch:
+        if "Next" not in catcher:
+            raise InvalidCatcherException(name, catcher)
+
+
+def compile_recovery(name, retry, catch, index, position):
+    """ Compile the Retry and Catch rules of the state at a position into a
+        function recovering from an exception it raised, with the names of
+        the states caught errors transition to resolved in index once.
+
+        The function is given the exception, a dictionary counting the
+        attempts made by each retrier, and the input of the failed state.
+        It returns the number of seconds to wait, the position of the state
+        to continue from and its input, or raises the exception again when
+        no rule handles it.
+    """
+    from estado.machine import OperationalError
+
+    catchers = []
+
+    for catcher in catch:
+        target = catcher["Next"]
+
+        if target not in index:
+            raise OperationalError(
+                f"State {name} catches errors with unknown state {target}"
+            )
+
+        result_path = catcher.get("ResultPath", "$")
+        set_result = None if result_path is None else \
+            compile_setter(result_path)
+
+        catchers.append((catcher["ErrorEquals"], index[target], set_result))
+
+    retriers = list(enumerate(retry))
+
+    def recover(error, attempts, data):
+        for number, retrier in retriers:
+            if matches(retrier["ErrorEquals"], error):
+                attempts[number] = attempts.get(number, 0) + 1
+                delay = retry_delay(retrier, attempts[number])
+
+                if delay is not None:
+                    return delay, position, data
+                break
+
+        for error_equals, target, set_result in catchers:
+            if matches(error_equals, error):
+                if set_result is None:
+                    return 0, target, data
+
+                output = set_result(data, {
+                    "Error": error_name(error),
+                    "Cause": str(error)
+                }, name)
+
+                if isinstance(output, dict):
+                    output = Input(**output)
+
+                return 0, target, output
+
+        raise error
+
+    return recover
+
+
+class InvalidCatcherException(Exception):
+
+    def __init__(self, name, catcher):
+        message = f"Catch rule {catcher} of state {name} has no Next state"
+        Exception.__init__(self, message)
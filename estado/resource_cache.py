@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from estado.hash_utils import freeze
+
+# Returned by ResourceCache.get when there is no usable entry for a key
+MISSING = object()
+
+
+class ResourceCache:
+    """ A least recently used cache for the results of a pure resource,
+        keyed on the keyword arguments the resource is invoked with.
+
+        At most maxsize results are kept, and when ttl is set results
+        expire ttl seconds after they were stored. Invocations whose
+        arguments cannot be hashed bypass the cache.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, clock=monotonic):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypasses = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def key(self, kwargs):
+        """ Obtain the cache key for the keyword arguments of an invocation,
+            or None if they cannot be hashed.
+        """
+        try:
+            return freeze(kwargs)
+        except TypeError:
+            self.bypasses += 1
+            return None
+
+
+    def get(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            expires, value = entry
+
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+
+    def put(self, key, value):
+
+        expires = None if self.ttl is None else self.clock() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+
+
+    def info(self):
+        """ Obtain the counters of the cache
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "bypasses": self.bypasses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize
+        }
+
+
+    def __reduce__(self):
+        # Entries and counters stay in the process that produced them
+        return (ResourceCache, (self.maxsize, self.ttl, self.clock))
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __repr__(self):
+        return f"<ResourceCache:{len(self._entries)}/{self.maxsize}>"
@@ -0,0 +1,217 @@
+import asyncio
+from collections import deque
+from threading import Event, Lock
+from time import monotonic, sleep
+
+
+class ResourceLimits:
+    """ Limits on the invocations of a single registry resource.
+
+        max_in_flight bounds the number of invocations running at once,
+        further invocations queue until a running one completes. rate, in
+        invocations per second, is enforced with a token bucket holding up
+        to burst tokens, delaying invocations that exceed it. The same
+        limits apply to invocations from threads and from coroutines.
+    """
+
+    def __init__(self, max_in_flight=None, rate=None, burst=1,
+                 clock=monotonic, sleep=sleep):
+
+        self.max_in_flight = max_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+
+        self.in_flight = 0
+        self.invocations = 0
+        self.max_queued = 0
+        self.queue_time = 0.0
+        self.throttled = 0
+        self.throttle_time = 0.0
+
+        self._tokens = burst
+        self._updated = clock()
+        self._waiters = deque()
+        self._lock = Lock()
+
+    def acquire(self):
+        """ Block the calling thread until an invocation may start
+        """
+        if self.max_in_flight is not None:
+            self._acquire_slot()
+
+        if self.rate is not None:
+            delay = self._reserve_token()
+            if delay > 0:
+                # The slot is released if waiting is interrupted, as the
+                # invocation will not release it
+                try:
+                    self.sleep(delay)
+                except BaseException:
+                    self.release()
+                    raise
+
+
+    async def acquire_async(self):
+        """ Wait, without blocking the event loop, until an invocation
+            may start
+        """
+        if self.max_in_flight is not None:
+            await self._acquire_slot_async()
+
+        if self.rate is not None:
+            delay = self._reserve_token()
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    self.release()
+                    raise
+
+
+    def release(self):
+        """ Mark an invocation as complete, handing its slot over to the
+            longest queued invocation if there is one.
+        """
+        if self.max_in_flight is None:
+            return
+
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+
+            wake = self._waiters.popleft()
+
+        wake()
+
+
+    def metrics(self):
+        """ Obtain the counters of the limits, with times in seconds
+        """
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_queued": self.max_queued,
+            "queue_time": self.queue_time,
+            "invocations": self.invocations,
+            "throttled": self.throttled,
+            "throttle_time": self.throttle_time
+        }
+
+
+    def _acquire_slot(self):
+
+        with self._lock:
+            self.invocations += 1
+
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return
+
+            event = Event()
+            self._enqueue(event.set)
+
+        queued_at = self.clock()
+        event.wait()
+        self._record_queue_time(queued_at)
+
+
+    async def _acquire_slot_async(self):
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            self.invocations += 1
+
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return
+
+            granted = loop.create_future()
+
+            def wake():
+                loop.call_soon_threadsafe(self._grant, granted)
+
+            self._enqueue(wake)
+
+        queued_at = self.clock()
+
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(wake)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+
+            # A slot granted before the cancellation took effect is not
+            # released by _grant, so it has to be released here
+            if handed_over and granted.done() and not granted.cancelled():
+                self.release()
+            raise
+
+        self._record_queue_time(queued_at)
+
+
+    def _grant(self, granted):
+
+        if granted.done():
+            # The waiter was cancelled, so its slot is passed on
+            self.release()
+        else:
+            granted.set_result(None)
+
+
+    def _record_queue_time(self, queued_at):
+        waited = self.clock() - queued_at
+        with self._lock:
+            self.queue_time += waited
+
+
+    def _enqueue(self, wake):
+        self._waiters.append(wake)
+        self.max_queued = max(self.max_queued, len(self._waiters))
+
+
+    def _reserve_token(self):
+        """ Take a token from the bucket, returning how long the caller
+            has to wait for it. The bucket may go negative, in which case
+            the deficit is a queue of reservations for later callers.
+        """
+        with self._lock:
+            if self.max_in_flight is None:
+                self.invocations += 1
+
+            now = self.clock()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0
+
+            delay = -self._tokens / self.rate
+            self.throttled += 1
+            self.throttle_time += delay
+
+            return delay
+
+
+    def __reduce__(self):
+        # Counters and queues stay in the process that produced them
+        return (
+            ResourceLimits,
+            (self.max_in_flight, self.rate, self.burst, self.clock,
+             self.sleep)
+        )
+
+
+    def __repr__(self):
+        return f"<ResourceLimits:{self.in_flight}/{self.max_in_flight}>"
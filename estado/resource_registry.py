@@ -1,30 +1,287 @@
-from estado.hash_utils import slug_hash
+import asyncio
+from functools import partial
+from importlib import import_module
+from inspect import iscoroutinefunction
+from weakref import WeakKeyDictionary
+
+from estado.hash_utils import unique_name
+from estado.resource_cache import MISSING
 
 class Registry:
+    """ A named collection of function resources that Task states invoke.
+
+        Resources may be plain functions or coroutine functions. When
+        invoked asynchronously, plain functions run in executor (the event
+        loop's default executor if None), and max_concurrency caps the
+        number of invocations in flight across all resources of the
+        registry on each event loop.
+
+        Resources may be registered by import path, such as
+        "package.module:function". Registries are pickled as the import
+        paths of their resources, so that they can be sent to worker
+        processes, which import each resource once when unpickling.
 
-    def __init__(self, name="registry"):
+        Pure resources may be registered with a ResourceCache, in which
+        case their results are reused for repeated keyword arguments, and
+        any resource may be registered with ResourceLimits bounding its
+        concurrent invocations and rate.
+    """
+
+    def __init__(self, name="registry", max_concurrency=None,
+                 executor=None):
 
         self.name = name
         self.functions = {}
+        self.references = {}
+        self.caches = {}
+        self.limits = {}
+        self.max_concurrency = max_concurrency
+        self.executor = executor
+
+        self._coroutine_functions = set()
+        self._semaphores = WeakKeyDictionary()
 
-    def register_function(self, fn, name=""):
+    def register_function(self, fn, name="", cache=None, limits=None):
 
         if not name:
-            name = slug_hash()
+            name = unique_name()
+
+        if cache is not None:
+            self.caches[name] = cache
+        else:
+            self.caches.pop(name, None)
+
+        if limits is not None:
+            self.limits[name] = limits
+        else:
+            self.limits.pop(name, None)
+
+        if isinstance(fn, str):
+            self.references[name] = fn
+            fn = resolve_reference(fn)
+        else:
+            self.references.pop(name, None)
 
         self.functions[name] = fn
 
+        if iscoroutinefunction(fn):
+            self._coroutine_functions.add(name)
+        else:
+            self._coroutine_functions.discard(name)
+
+
+    def is_coroutine_function(self, name):
+        return name in self._coroutine_functions
+
 
     def invoke_function(self, name, **kwargs):
 
+        cache = self.caches.get(name)
+
+        if cache is None:
+            return self._invoke(name, kwargs)
+
+        key = cache.key(kwargs)
+
+        if key is None:
+            return self._invoke(name, kwargs)
+
+        value = cache.get(key)
+
+        if value is MISSING:
+            value = self._invoke(name, kwargs)
+            cache.put(key, value)
+
+        return value
+
+
+    def _invoke(self, name, kwargs):
+
         fn = self.functions[name]
+        limits = self.limits.get(name)
+
+        if limits is None:
+            return self._call(name, fn, kwargs)
+
+        limits.acquire()
+        try:
+            return self._call(name, fn, kwargs)
+        finally:
+            limits.release()
+
+
+    def _call(self, name, fn, kwargs):
+
+        if name in self._coroutine_functions:
+            return asyncio.run(fn(**kwargs))
 
         return fn(**kwargs)
 
 
+    async def invoke_function_async(self, name, **kwargs):
+        """ Invoke a resource from a coroutine. Coroutine functions are
+            awaited directly, other functions are run in the executor of
+            the registry so that they do not block the event loop.
+        """
+        cache = self.caches.get(name)
+
+        if cache is None:
+            return await self._invoke_limited(name, kwargs)
+
+        key = cache.key(kwargs)
+
+        if key is None:
+            return await self._invoke_limited(name, kwargs)
+
+        value = cache.get(key)
+
+        if value is MISSING:
+            value = await self._invoke_limited(name, kwargs)
+            cache.put(key, value)
+
+        return value
+
+
+    async def _invoke_limited(self, name, kwargs):
+
+        limits = self.limits.get(name)
+
+        if limits is None:
+            return await self._invoke_bounded(name, kwargs)
+
+        await limits.acquire_async()
+        try:
+            return await self._invoke_bounded(name, kwargs)
+        finally:
+            limits.release()
+
+
+    async def _invoke_bounded(self, name, kwargs):
+
+        semaphore = self._semaphore()
+
+        if semaphore is None:
+            return await self._invoke_async(name, kwargs)
+
+        async with semaphore:
+            return await self._invoke_async(name, kwargs)
+
+
+    async def _invoke_async(self, name, kwargs):
+
+        fn = self.functions[name]
+
+        if name in self._coroutine_functions:
+            return await fn(**kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(fn, **kwargs)
+        )
+
+
+    def _semaphore(self):
+        """ Obtain the semaphore enforcing max_concurrency on the running
+            event loop, as asyncio primitives cannot be shared across loops.
+        """
+        if self.max_concurrency is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+
+        return semaphore
+
+
+    def __getstate__(self):
+
+        references = {}
+
+        for name, fn in self.functions.items():
+            reference = self.references.get(name) or import_reference(fn)
+
+            if reference is None:
+                raise RegistryException(
+                    f"Resource {name} of registry {self.name} cannot be " \
+                    f"sent to another process. Register it by import " \
+                    f"path, as in 'package.module:function'"
+                )
+
+            references[name] = reference
+
+        return {
+            "name": self.name,
+            "max_concurrency": self.max_concurrency,
+            "references": references,
+            "caches": self.caches,
+            "limits": self.limits
+        }
+
+
+    def __setstate__(self, state):
+
+        Registry.__init__(
+            self,
+            name=state["name"],
+            max_concurrency=state["max_concurrency"]
+        )
+
+        for name, reference in state["references"].items():
+            self.register_function(
+                reference, name,
+                cache=state["caches"].get(name),
+                limits=state["limits"].get(name)
+            )
+
+
+def resolve_reference(reference):
+    """ Import the object designated by a "package.module:attribute" path
+    """
+    module_name, _, attribute_path = reference.partition(":")
+
+    if not attribute_path:
+        raise RegistryException(
+            f"Invalid import path {reference}, expected " \
+            f"'package.module:function'"
+        )
+
+    resolved = import_module(module_name)
+    for attribute in attribute_path.split("."):
+        resolved = getattr(resolved, attribute)
+
+    return resolved
+
+
+def import_reference(fn):
+    """ Obtain the import path of a function, or None if the function
+        cannot be imported by name, as is the case for lambdas and
+        functions defined inside other functions.
+    """
+    module_name = getattr(fn, "__module__", None)
+    qualified_name = getattr(fn, "__qualname__", None)
+
+    if not module_name or not qualified_name or "<" in qualified_name:
+        return None
+
+    reference = f"{module_name}:{qualified_name}"
+
+    try:
+        if resolve_reference(reference) is fn:
+            return reference
+    except (ImportError, AttributeError):
+        pass
+
+    return None
+
+
 class RegistryException(Exception):
 
     def __init__(self, message):
         Exception.__init__(self, message)
 
-        
+
@@ -1,5 +1,7 @@
 class Result:
 
+    __slots__ = ("path", "results")
+
     def __init__(self, result=None, path="$.result", **results):
 
         self.path = path
@@ -0,0 +1,155 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from heapq import heappop, heappush
+from itertools import count
+from time import sleep, time
+
+from estado.execution import Execution
+
+
+class VirtualClock:
+    """ A clock for simulations, in seconds since the epoch, which only
+        moves forward when slept on, and then at once.
+    """
+
+    def __init__(self, start=0.0):
+
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.now += max(0, seconds)
+
+
+    def __repr__(self):
+        return f"<VirtualClock:{self.now}>"
+
+
+class Scheduler:
+    """ Runs many executions, parking executions which reach a Wait state,
+        or back off before retrying a failed state, in a timer heap rather
+        than blocking on them, and advancing them again when due.
+
+        Executions are advanced on the calling thread, or on the threads
+        of an executor if one is given, which then keep advancing other
+        executions while some are parked.
+
+        The clock, returning seconds since the epoch, and sleep are
+        pluggable, so that with a VirtualClock a simulation waits no time
+        at all:
+
+            clock = VirtualClock()
+            scheduler = Scheduler(clock=clock, sleep=clock.sleep)
+
+        Executions failing are left with their error, and do not stop
+        other executions.
+    """
+
+    def __init__(self, clock=time, sleep=sleep, executor=None):
+
+        self.clock = clock
+        self.sleep = sleep
+        self.executor = executor
+
+        self.completed = 0
+        self.failed = 0
+
+        self._ready = deque()
+        self._timers = []
+        self._sequence = count()
+
+    def submit(self, machine, input=None, id=None):
+        """ Add an execution of a machine from its start state, which is
+            run by run, and return it
+        """
+        execution = Execution(machine.plan(), input, id=id)
+        self._ready.append(execution)
+        return execution
+
+
+    @property
+    def pending(self):
+        """ The number of executions not yet done
+        """
+        return len(self._ready) + len(self._timers)
+
+
+    def run(self, until=None):
+        """ Advance executions until all are done, or until the clock
+            reaches until, and return the number of executions done
+        """
+        clock = self.clock
+        ready = self._ready
+        timers = self._timers
+        executor = self.executor
+        done = self.completed + self.failed
+
+        # Futures of the executions being advanced by the executor
+        advancing = {}
+
+        while ready or timers or advancing:
+            now = clock()
+
+            while timers and timers[0][0] <= now:
+                ready.append(heappop(timers)[2])
+
+            if executor is None:
+                while ready:
+                    execution = ready.popleft()
+
+                    try:
+                        delay = execution.advance(now)
+                    except Exception:
+                        self.failed += 1
+                    else:
+                        self._park(execution, now, delay)
+            else:
+                while ready:
+                    execution = ready.popleft()
+                    future = executor.submit(execution.advance, now)
+                    advancing[future] = (execution, now)
+
+            if advancing:
+                timeout = max(0, timers[0][0] - clock()) if timers else None
+                finished, _ = wait(advancing, timeout, FIRST_COMPLETED)
+
+                for future in finished:
+                    execution, started = advancing.pop(future)
+
+                    try:
+                        delay = future.result()
+                    except Exception:
+                        self.failed += 1
+                    else:
+                        self._park(execution, started, delay)
+
+                continue
+
+            if not timers:
+                break
+
+            due = timers[0][0]
+
+            if until is not None and due > until:
+                self.sleep(max(0, until - clock()))
+                break
+
+            self.sleep(max(0, due - clock()))
+
+        return self.completed + self.failed - done
+
+
+    def _park(self, execution, now, delay):
+
+        if delay is None:
+            self.completed += 1
+        else:
+            due = now + delay
+            heappush(self._timers, (due, next(self._sequence), execution))
+
+
+    def __repr__(self):
+        return f"<Scheduler:{self.pending} pending>"
@@ -1,13 +1,31 @@
-from estado.hash_utils import slug_hash
+from estado.hash_utils import unique_name
 from estado.input import Input
+from estado.paths import DISCARD, flow_paths
 from estado.result import Result
 
 SUPPORTED_STATE_TYPES = [
     "Pass",
-    "Task"
+    "Task",
+    "Choice",
+    "Map",
+    "Parallel",
+    "Wait"
 ]
 
 class State:
+    """ Base class of the states of a machine.
+
+        The input and result of a state are kept as configured, and only
+        normalized into Input and Result objects when first accessed.
+    """
+
+    __slots__ = (
+        "type", "name", "next", "end", "_input", "_result", "input_path",
+        "result_path", "output_path"
+    )
+
+    # Slots holding caches, which are rebuilt rather than pickled
+    _transient_slots = ()
 
     def __init__(self, state_config):
 
@@ -21,23 +39,83 @@ class State:
         name = state_config.get("name")
 
         if not name:
-            self.name = slug_hash()
+            self.name = unique_name()
         else:
             self.name = name
         
-        self.input = self.normalize_result_or_input(
-            state_config.get("input"),
-            Input
-        )
-
-        self.result = self.normalize_result_or_input(
-            state_config.get("result"),
-            Result
-        )
+        self._input = state_config.get("input")
+        self._result = state_config.get("result")
 
         self.next = state_config.get("next")
         self.end = state_config.get("end", None)
 
+        self.input_path = state_config.get("input_path")
+        self.result_path = state_config.get("result_path")
+        self.output_path = state_config.get("output_path")
+
+
+    @property
+    def input(self):
+        input = self._input
+        if input.__class__ is not Input:
+            input = self._input = self.normalize_result_or_input(
+                input,
+                Input
+            )
+        return input
+
+
+    @input.setter
+    def input(self, input):
+        self._input = input
+
+
+    @property
+    def result(self):
+        result = self._result
+        if result.__class__ is not Result:
+            result = self._result = self.materialize_result(result)
+        return result
+
+
+    @result.setter
+    def result(self, result):
+        self._result = result
+
+
+    def materialize_result(self, result):
+        """ Build the Result object of the state from its configured result
+        """
+        return self.normalize_result_or_input(result, Result)
+
+
+    def __getstate__(self):
+
+        slots = {}
+
+        for class_ in type(self).__mro__:
+            for slot in getattr(class_, "__slots__", ()):
+                if slot not in self._transient_slots and hasattr(self, slot):
+                    slots[slot] = getattr(self, slot)
+
+        # Subclasses without __slots__ keep their other attributes in a
+        # dictionary
+        return (getattr(self, "__dict__", None), slots)
+
+
+    def __setstate__(self, state):
+
+        attributes, slots = state
+
+        if attributes:
+            self.__dict__.update(attributes)
+
+        for slot in self._transient_slots:
+            setattr(self, slot, None)
+
+        for slot, value in slots.items():
+            setattr(self, slot, value)
+
 
     def normalize_result_or_input(self, result_or_input, Kind):
         """ In Estado, an input or result may be passed as a Python dictionary,
@@ -59,9 +137,10 @@ class State:
     def validate(self):
         """ Sanity checks validating that there isn't a conflict between 
             properties determining a state's terminal status and the 'next'
-            property.
+            property. Terminal states linked by Machine.register have the
+            next property "End".
         """ 
-        if self.terminal() and self.next:
+        if self.terminal() and self.next and self.next != "End":
             raise TerminalStateConflictException()
 
         if not self.terminal() and not self.next:
@@ -71,6 +150,13 @@ class State:
             )                
 
 
+    async def interpret_async(self, input=None):
+        """ Interpret the state from a coroutine. States which do not
+            perform any I/O are interpreted synchronously.
+        """
+        return self.interpret(input=input)
+
+
     def compile_(self):
         """ Compilation logic common to each state type
         """
@@ -85,12 +171,73 @@ class State:
             compiled["End"] = False
 
 
-        if self.result:
-            compiled["Result"] = self.result.results
-            compiled["ResultPath"] = self.result.path
+        # A state configured with neither a result nor an input cannot have
+        # a result, which avoids building Result objects to compile it
+        if self._result is not None or self._input:
+            result = self.result
+            if result:
+                compiled["Result"] = result.results
+                compiled["ResultPath"] = result.path
+
+        if self.input_path is not None:
+            compiled["InputPath"] = self.input_path
+
+        if self.result_path is not None:
+            compiled["ResultPath"] = None if self.result_path is DISCARD \
+                else self.result_path
+
+        if self.output_path is not None:
+            compiled["OutputPath"] = self.output_path
+
         return compiled
 
 
+    def data_flow(self):
+        """ The input, result and output paths of the state, or None when
+            none is set and its data is passed as it is
+        """
+        return flow_paths(self.input_path, self.result_path, self.output_path)
+
+
+    def router(self, index):
+        """ States whose next state depends on their output return a
+            function from their output to the position of the next state,
+            given the positions of the states of the machine by name.
+        """
+        return None
+
+
+    def transitions(self):
+        """ The names of the states the state may transition to
+        """
+        if self.terminal() or self.next is None:
+            return ()
+        return (self.next,)
+
+
+    def machines(self):
+        """ The machines interpreted by the state, such as the branches of
+            a Parallel state
+        """
+        return ()
+
+
+    def recovery(self, index, position):
+        """ States recovering from errors with Retry or Catch rules return
+            a function compiled by estado.recovery.compile_recovery, given
+            the positions of the states of the machine by name, and their
+            own position. Other states return None.
+        """
+        return None
+
+
+    def asynchronous(self):
+        """ Whether interpreting the state awaits a coroutine function, and
+            is best done on an event loop
+        """
+        return False
+
+
     def terminal(self):
         """ Any state except for Choice, Succeed, and Fail MAY have a field 
             named "End" whose value MUST be a boolean. The term “Terminal State” 
@@ -126,8 +273,7 @@ class State:
             machine_.register(other)
             
         elif isinstance(other, Machine):
-            for state in other.states:
-                machine_ += other.states[state]
+            machine_.extend(other.states.values())
                 
         return machine_
 
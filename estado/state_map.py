@@ -0,0 +1,219 @@
+from collections import OrderedDict
+from collections.abc import ItemsView, ValuesView
+from threading import Lock
+
+_materialize_lock = Lock()
+
+
+class StateMap(OrderedDict):
+    """ The states of a machine, by name.
+
+        Entries may be DeferredState objects, standing for states which
+        are only built the first time they are looked up. peek obtains an
+        entry without building it.
+    """
+
+    def __getitem__(self, name):
+        state = OrderedDict.__getitem__(self, name)
+
+        if state.__class__ is DeferredState:
+            state = self.materialize(name, state)
+
+        return state
+
+
+    def peek(self, name):
+        """ Obtain the entry for a name, deferred or not
+        """
+        return OrderedDict.__getitem__(self, name)
+
+
+    def materialize(self, name, deferred):
+
+        with _materialize_lock:
+            state = OrderedDict.__getitem__(self, name)
+
+            if state is deferred:
+                state = deferred.build()
+                OrderedDict.__setitem__(self, name, state)
+
+        return state
+
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+
+    def values(self):
+        return ValuesView(self)
+
+
+    def items(self):
+        return ItemsView(self)
+
+
+    def __reduce__(self):
+        # Deferred entries are pickled as they are, rather than built
+        return (
+            self.__class__, (), None, None,
+            iter(OrderedDict.items(self))
+        )
+
+
+class DeferredState:
+    """ Stands for a state of a machine loaded from Amazon States Language,
+        which is built from its definition when first needed. The
+        transitions and compiled form of the state are available without
+        building it.
+    """
+
+    __slots__ = (
+        "name", "definition", "registries", "states", "pass_result_paths",
+        "_state"
+    )
+
+    def __init__(self, name, definition, registries, states,
+                 pass_result_paths=False):
+
+        self.name = name
+        self.definition = definition
+        self.registries = registries
+        self.states = states
+        self.pass_result_paths = pass_result_paths
+        self._state = None
+
+    @property
+    def type(self):
+        return self.definition["Type"]
+
+
+    @property
+    def next(self):
+        return self.definition.get("Next")
+
+
+    @property
+    def end(self):
+        return self.definition.get("End", False)
+
+
+    def terminal(self):
+        return self.end or self.type in ("Succeed", "Fail")
+
+
+    def router(self, index):
+        if self.type == "Choice":
+            return self.materialize().router(index)
+        return None
+
+
+    def validate(self):
+        from estado.choice_state import InvalidChoiceRuleException
+        from estado.recovery import check_catchers
+        from estado.state import TerminalStateConflictException
+
+        if self.type != "Choice" and not self.terminal() and not self.next:
+            raise TerminalStateConflictException(
+                "State is not marked as end, but has no next value specified"
+            )
+
+        for rule in self.definition.get("Choices", ()):
+            if "Next" not in rule:
+                raise InvalidChoiceRuleException(
+                    rule, f"Choice rule {rule} has no Next state"
+                )
+
+        check_catchers(self.name, self.definition.get("Catch", ()))
+
+
+    def transitions(self):
+        # Nested machines are not built, so are not validated
+        definition = self.definition
+        targets = []
+
+        if not self.terminal() and self.next is not None:
+            targets.append(self.next)
+
+        # Rules without a Next state are reported by validate
+        targets.extend(
+            rule["Next"] for rule in definition.get("Choices", ())
+            if "Next" in rule
+        )
+
+        if definition.get("Default") is not None:
+            targets.append(definition["Default"])
+
+        targets.extend(
+            catcher["Next"] for catcher in definition.get("Catch", ())
+            if "Next" in catcher
+        )
+
+        return tuple(targets)
+
+
+    def machines(self):
+        return ()
+
+
+    def asynchronous(self):
+        from estado.asl import asynchronous_definition
+
+        return asynchronous_definition(self.definition, self.registries)
+
+
+    def data_flow(self):
+        from estado.paths import definition_paths, flow_paths
+
+        return flow_paths(
+            **definition_paths(self.definition, self.pass_result_paths)
+        )
+
+
+    def recovery(self, index, position):
+        from estado.recovery import compile_recovery
+
+        retry = self.definition.get("Retry", ())
+        catch = self.definition.get("Catch", ())
+
+        if not retry and not catch:
+            return None
+
+        return compile_recovery(self.name, retry, catch, index, position)
+
+
+    def build(self):
+        from estado.asl import load_state
+
+        return load_state(
+            self.name, self.definition, self.registries,
+            self.pass_result_paths
+        )
+
+
+    def materialize(self):
+        """ Obtain the state object, building it on first use
+        """
+        state = self._state
+
+        if state is None:
+            state = self._state = self.states[self.name]
+
+        return state
+
+
+    def interpret(self, input=None):
+        return self.materialize().interpret(input=input)
+
+
+    async def interpret_async(self, input=None):
+        return await self.materialize().interpret_async(input=input)
+
+
+    def compile(self):
+        return {
+            self.name: self.definition
+        }
+
+
+    def __repr__(self):
+        return f"<Deferred{self.type}:{self.name}>"
@@ -1,25 +1,88 @@
 from estado.input import Input
+from estado.paths import definition_paths
+from estado.recovery import check_catchers, compile_recovery
+from estado.resource_registry import RegistryException
 from estado.result import Result
 from estado.state import State
 
 
 class Task(State):
 
+    __slots__ = ("resource", "registry", "retry", "catch")
+
     def __init__(self, name="", resource="",
                  registry=None, next=None,
-                 end=False):
+                 end=False, retry=(), catch=(), input_path=None,
+                 result_path=None, output_path=None):
 
         state_config = {
             "name": name,
             "type": "Task",
             "next": next,
-            "end": end
+            "end": end,
+            "input_path": input_path,
+            "result_path": result_path,
+            "output_path": output_path
         }
             
         State.__init__(self, state_config)
 
         self.resource = resource
         self.registry = registry
+        self.retry = list(retry)
+        self.catch = list(catch)
+
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Task state from its Amazon States Language definition,
+            resolving its resource against registries indexed by name
+        """
+        registry_name, _, resource = definition["Resource"].partition(":")
+
+        if registry_name not in registries:
+            raise RegistryException(
+                f"No registry named {registry_name} was provided for " \
+                f"resource {definition['Resource']}"
+            )
+
+        return cls(
+            name=name,
+            resource=resource,
+            registry=registries[registry_name],
+            next=definition.get("Next"),
+            end=definition.get("End", False),
+            retry=definition.get("Retry", ()),
+            catch=definition.get("Catch", ()),
+            **definition_paths(definition)
+        )
+
+
+    def validate(self):
+        State.validate(self)
+        check_catchers(self.name, self.catch)
+
+
+    def transitions(self):
+        # Catch rules without a Next state are reported by validate
+        return State.transitions(self) + tuple(
+            catcher["Next"] for catcher in self.catch if "Next" in catcher
+        )
+
+
+    def recovery(self, index, position):
+
+        if not self.retry and not self.catch:
+            return None
+
+        return compile_recovery(
+            self.name, self.retry, self.catch, index, position
+        )
+
+
+    def asynchronous(self):
+        return self.registry.is_coroutine_function(self.resource)
 
 
     def interpret(self, input=None):
@@ -35,6 +98,19 @@ class Task(State):
         )
 
 
+    async def interpret_async(self, input=None):
+
+        if not input:
+            input = Input()
+
+        return Result(
+            await self.registry.invoke_function_async(
+                self.resource,
+                **input.inputs
+            )
+        )
+
+
     def compile(self):
 
         compiled = {
@@ -42,6 +118,12 @@ class Task(State):
             "Resource": f"{self.registry.name}:{self.resource}"
         }
 
+        if self.retry:
+            compiled["Retry"] = self.retry
+
+        if self.catch:
+            compiled["Catch"] = self.catch
+
         return {
             self.name: compiled
         }
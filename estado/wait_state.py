@@ -0,0 +1,156 @@
+import asyncio
+from datetime import datetime, timezone
+from time import sleep, time
+
+from estado.paths import MISSING, compile_flow, compile_path, definition_paths
+from estado.state import State
+
+
+def parse_timestamp(timestamp):
+    """ Seconds since the epoch of an ISO 8601 timestamp, taken as UTC
+        when it has no offset
+    """
+    moment = datetime.fromisoformat(timestamp)
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return moment.timestamp()
+
+
+class Wait(State):
+    """ A state delaying the execution for a number of seconds, or until a
+        timestamp, either given or found at a path of its input, which it
+        passes on unchanged.
+
+        Interpreting a Wait state blocks the calling thread, or the calling
+        coroutine when interpreted asynchronously. A Scheduler instead
+        parks the execution until the wait is over, without blocking.
+    """
+
+    __slots__ = ("seconds", "seconds_path", "timestamp", "timestamp_path")
+
+    def __init__(self, seconds=None, seconds_path=None, timestamp=None,
+                 timestamp_path=None, name="", next=None, end=False,
+                 input_path=None, output_path=None):
+
+        state_config = {
+            "name": name,
+            "type": "Wait",
+            "next": next,
+            "end": end,
+            "input_path": input_path,
+            "output_path": output_path
+        }
+
+        State.__init__(self, state_config)
+
+        waits = (seconds, seconds_path, timestamp, timestamp_path)
+
+        if sum(wait is not None for wait in waits) != 1:
+            raise InvalidWaitException(name)
+
+        self.seconds = seconds
+        self.seconds_path = seconds_path
+        self.timestamp = timestamp
+        self.timestamp_path = timestamp_path
+
+    @classmethod
+    def from_definition(cls, name, definition, registries,
+                        pass_result_paths=False):
+        """ Build a Wait state from its Amazon States Language definition
+        """
+        return cls(
+            seconds=definition.get("Seconds"),
+            seconds_path=definition.get("SecondsPath"),
+            timestamp=definition.get("Timestamp"),
+            timestamp_path=definition.get("TimestampPath"),
+            name=name,
+            next=definition.get("Next"),
+            end=definition.get("End", False),
+            **definition_paths(definition)
+        )
+
+
+    def delay(self, input, now):
+        """ The number of seconds to wait from now, in seconds since the
+            epoch, given an input
+        """
+        if self.seconds is not None:
+            seconds = self.seconds
+        elif self.seconds_path is not None:
+            seconds = compile_path(self.seconds_path)(input)
+        else:
+            timestamp = self.timestamp
+            if timestamp is None:
+                timestamp = compile_path(self.timestamp_path)(input)
+
+            if not isinstance(timestamp, str):
+                raise InvalidWaitException(self.name, input=input)
+
+            seconds = parse_timestamp(timestamp) - now
+
+        if seconds is MISSING or isinstance(seconds, bool) or \
+           not isinstance(seconds, (int, float)):
+            raise InvalidWaitException(self.name, input=input)
+
+        return max(0, seconds)
+
+
+    def parker(self, paths=None):
+        """ Obtain a function from the data given to the state and the
+            current time to the number of seconds to wait and the data
+            passed on, with which a Scheduler parks executions
+        """
+        delay = self.delay
+
+        if paths is None:
+            return lambda data, now: (delay(data, now), data)
+
+        before, after = compile_flow(self.name, *paths)
+
+        def park(data, now):
+            input = before(data)
+            return delay(input, now), after(data, input)
+
+        return park
+
+
+    def interpret(self, input=None):
+        sleep(self.delay(input, time()))
+        return input
+
+
+    async def interpret_async(self, input=None):
+        await asyncio.sleep(self.delay(input, time()))
+        return input
+
+
+    def compile(self):
+
+        compiled = self.compile_()
+
+        for field, value in (("Seconds", self.seconds),
+                             ("SecondsPath", self.seconds_path),
+                             ("Timestamp", self.timestamp),
+                             ("TimestampPath", self.timestamp_path)):
+            if value is not None:
+                compiled[field] = value
+
+        return {
+            self.name: compiled
+        }
+
+
+class InvalidWaitException(Exception):
+
+    def __init__(self, name, input=MISSING):
+
+        if input is MISSING:
+            message = f"Wait state {name} needs exactly one of a number " \
+                f"of seconds or a timestamp, given or at a path of its input"
+        else:
+            message = f"Wait state {name} found no number of seconds or " \
+                f"timestamp in its input {input}"
+
+        Exception.__init__(self, message)
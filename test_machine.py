@@ -1,12 +1,37 @@
-from estado.machine import Machine, OperationalError
+from estado.checkpoint import CheckpointLog
+from estado.choice_state import Choice, NoChoiceMatchedException
+from estado.hash_utils import IdAllocator, freeze
+from estado.machine import InvalidMachineException, Machine, OperationalError
 from estado.input import Input
+from estado.machine_cache import MachineCache
+from estado.map_state import Map, MapItemsException
+from estado.parallel_state import Parallel
 from estado.pass_state import Pass
+from estado.paths import DISCARD, PathNotFoundException, compile_setter, \
+    document
+from estado.profiling import Profiler
 from estado.result  import Result
-from estado.resource_registry import Registry
+from estado.resource_cache import ResourceCache
+from estado.resource_limits import ResourceLimits
+from estado.resource_registry import Registry, RegistryException
+from estado.scheduler import Scheduler, VirtualClock
 from estado.state import InvalidStateTypeException, TerminalStateConflictException
 from estado.state import State
+from estado.state_map import DeferredState
 from estado.task_state import Task
-
+from estado.wait_state import InvalidWaitException, Wait
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import asyncio
+import copy
+import io
+import itertools
+import json
+import pickle
+import socket
+import threading
+import time
 import pytest
 
 
@@ -364,3 +389,1458 @@ def test_sugared_state_transition():
     # This assert shows that a machine can be created by adding two machines
     # and that machine is equivalent to one created with the OO interface
     assert machine.compile() == fourth_machine.compile()
+
+
+def test_compile_is_cached_and_invalidated_by_register():
+
+    machine = Machine()
+    machine.register(Pass(name="state_one"))
+
+    compiled = machine.compile()
+    assert machine.compile() is compiled
+
+    machine.register(Pass(name="state_two"))
+    recompiled = machine.compile()
+
+    assert recompiled is not compiled
+    assert recompiled["States"]["state_one"] == {
+        "Type": "Pass",
+        "Next": "state_two",
+        "End": False
+    }
+    assert list(recompiled["States"]) == ["state_one", "state_two"]
+
+    machine.register(Pass(result=3, name="state_one"), force=True)
+    assert machine.compile()["States"]["state_one"]["Result"] == {"result": 3}
+
+    machine.states["state_two"].result = Result(7)
+    machine.invalidate("state_two")
+    assert machine.compile()["States"]["state_two"]["Result"] == {"result": 7}
+
+    with pytest.raises(OperationalError):
+        machine.invalidate("missing")
+
+
+def test_machine_from_states():
+
+    states = (Pass(name=f"state_{i}") for i in range(3))
+    machine = Machine.from_states(states)
+
+    sugared = Pass(name="state_0") + Pass(name="state_1") + Pass(name="state_2")
+
+    assert machine.compile() == sugared.compile()
+    assert machine.last().terminal()
+
+    machine.extend(Pass(name=f"state_{i}") for i in range(3, 5))
+
+    assert machine.end_at() == "state_4"
+    assert machine.states["state_2"].next == "state_3"
+
+    with pytest.raises(OperationalError):
+        machine.extend([Pass(name="state_5"), Pass(name="state_0")])
+
+
+def test_interpret_follows_next(registry):
+
+    machine = Machine.from_states([
+        Pass(name="start"),
+        Task(name="add_two", resource="add_two", registry=registry),
+        Pass(name="done")
+    ])
+
+    input_ = Input(x=1)
+    assert machine.interpret(input=input_) == 3
+
+    plan = machine.plan()
+    assert machine.plan() is plan
+    assert plan.names == ("start", "add_two", "done")
+    assert plan.transitions == (1, 2, -1)
+
+    machine.states["start"].next = "done"
+    machine.invalidate("start")
+
+    assert machine.plan() is not plan
+    assert machine.interpret(input=input_) is input_
+
+    machine.states["start"].next = "missing"
+    machine.invalidate("start")
+
+    with pytest.raises(OperationalError):
+        machine.interpret(input=Input(x=1))
+
+
+def test_register_with_force_keeps_transitions():
+
+    machine = Pass(name="state_one") + Pass(name="state_two")
+    machine.register(Pass(result=3, name="state_one"), force=True)
+
+    assert machine.start_at() == "state_one"
+    assert machine.states["state_one"].next == "state_two"
+    assert machine.last().terminal()
+    assert machine.interpret() == 3
+
+
+def test_interpret_many(registry):
+
+    machine = Pass(name="start") + Task(
+        name="add_two",
+        resource="add_two",
+        registry=registry
+    )
+
+    results = machine.interpret_many(Input(x=x) for x in range(100))
+    assert [result.results["result"] for result in results] == \
+        list(range(2, 102))
+
+    results = machine.interpret_many(
+        (Input(x=x) for x in range(100)),
+        workers=4
+    )
+    assert [result.results["result"] for result in results] == \
+        list(range(2, 102))
+
+    results = machine.interpret_many(
+        (Input(x=x) for x in range(100)),
+        workers=4,
+        ordered=False
+    )
+    assert sorted(result.results["result"] for result in results) == \
+        list(range(2, 102))
+
+    # Inputs are consumed lazily, so an unbounded generator can be used
+    unbounded = (Input(x=x) for x in itertools.count())
+    results = machine.interpret_many(unbounded, workers=2, window=4)
+    assert [next(results) for _ in range(3)] == [2, 3, 4]
+    results.close()
+
+    assert machine.result is None
+
+
+def test_interpret_async(registry):
+
+    active = 0
+    most_active = 0
+
+    async def add_slowly(x):
+        nonlocal active, most_active
+        active += 1
+        most_active = max(active, most_active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return x + 2
+
+    registry.register_function(add_slowly, "add_slowly")
+    registry.max_concurrency = 10
+
+    assert registry.invoke_function("add_slowly", x=1) == 3
+
+    async_machine = Pass(name="start") + Task(
+        name="add_slowly",
+        resource="add_slowly",
+        registry=registry
+    )
+
+    sync_machine = Pass(name="start") + Task(
+        name="add_two",
+        resource="add_two",
+        registry=registry
+    )
+
+    async def run_all():
+        return await asyncio.gather(
+            *(async_machine.interpret_async(Input(x=x)) for x in range(50)),
+            *(sync_machine.interpret_async(Input(x=x)) for x in range(50))
+        )
+
+    results = asyncio.run(run_all())
+
+    assert results[:50] == list(range(2, 52))
+    assert results[50:] == list(range(2, 52))
+    assert most_active == 10
+
+
+def add_three(x):
+    return x + 3
+
+
+def test_interpret_many_with_processes():
+
+    registry = Registry()
+    registry.register_function(add_three, "add_three")
+    registry.register_function("test_machine:add_three", "add_three_by_path")
+
+    machine = Pass(name="start") + Task(
+        name="add_three",
+        resource="add_three_by_path",
+        registry=registry
+    )
+
+    results = machine.interpret_many(
+        (Input(x=x) for x in range(100)),
+        workers=2,
+        chunksize=8,
+        processes=True
+    )
+    assert [result.results["result"] for result in results] == \
+        list(range(3, 103))
+
+    registry.register_function(lambda x: x + 3, "add_three_lambda")
+
+    with pytest.raises(RegistryException):
+        pickle.dumps(registry)
+
+
+def test_resource_cache():
+
+    calls = []
+    now = 0
+
+    def total(values, scale=1):
+        calls.append(values)
+        return sum(values) * scale
+
+    cache = ResourceCache(maxsize=2, ttl=10, clock=lambda: now)
+
+    registry = Registry()
+    registry.register_function(total, "total", cache=cache)
+
+    assert registry.invoke_function("total", values=[1, 2]) == 3
+    assert registry.invoke_function("total", values=[1, 2]) == 3
+    assert registry.invoke_function("total", values=[1, 2], scale=2) == 6
+    assert len(calls) == 2
+    assert cache.hits == 1 and cache.misses == 2
+
+    # The least recently used entry is evicted once the cache is full
+    assert registry.invoke_function("total", values=[3]) == 3
+    assert cache.evictions == 1
+    assert registry.invoke_function("total", values=[1, 2], scale=2) == 6
+    assert registry.invoke_function("total", values=[1, 2]) == 3
+    assert len(calls) == 4
+
+    now = 20
+    assert registry.invoke_function("total", values=[1, 2], scale=2) == 6
+    assert cache.expirations == 1
+    assert len(calls) == 5
+
+    # Arguments which cannot be hashed bypass the cache
+    assert registry.invoke_function("total", values=bytearray(b"\x01")) == 1
+    assert cache.bypasses == 1
+
+    task = Task(name="total", resource="total", registry=registry)
+    assert task.interpret(Input(values=[3])) == 3
+    assert asyncio.run(task.interpret_async(Input(values=[3]))) == 3
+    assert len(calls) == 7
+
+    assert freeze({"a": [1, 2]}) == freeze({"a": [1, 2]})
+    assert freeze([1]) != freeze([1.0]) != freeze((1,))
+
+
+def test_resource_limits():
+
+    lock = threading.Lock()
+    active = 0
+    most_active = 0
+
+    def track():
+        nonlocal active, most_active
+        with lock:
+            active += 1
+            most_active = max(active, most_active)
+
+    def untrack():
+        nonlocal active
+        with lock:
+            active -= 1
+
+    def blocking(x):
+        track()
+        time.sleep(0.01)
+        untrack()
+        return x
+
+    async def awaiting(x):
+        track()
+        await asyncio.sleep(0.01)
+        untrack()
+        return x
+
+    limits = ResourceLimits(max_in_flight=2)
+
+    registry = Registry()
+    registry.register_function(blocking, "blocking", limits=limits)
+
+    machine = Pass(name="start") + Task(
+        name="blocking",
+        resource="blocking",
+        registry=registry
+    )
+
+    results = machine.interpret_many(
+        (Input(x=x) for x in range(16)),
+        workers=8
+    )
+    assert list(results) == list(range(16))
+    assert most_active == 2
+    assert limits.metrics()["in_flight"] == 0
+    assert limits.metrics()["max_queued"] > 0
+
+    most_active = 0
+    async_limits = ResourceLimits(max_in_flight=3)
+    registry.register_function(awaiting, "awaiting", limits=async_limits)
+
+    async def run_all():
+        return await asyncio.gather(*(
+            registry.invoke_function_async("awaiting", x=x)
+            for x in range(20)
+        ))
+
+    assert asyncio.run(run_all()) == list(range(20))
+    assert most_active == 3
+    assert async_limits.metrics()["in_flight"] == 0
+
+    # Rates are enforced with a token bucket, here on a simulated clock
+    now = 0.0
+
+    def advance(seconds):
+        nonlocal now
+        now += seconds
+
+    rate_limits = ResourceLimits(
+        rate=10, burst=2,
+        clock=lambda: now,
+        sleep=advance
+    )
+    registry.register_function(lambda x: x, "limited", limits=rate_limits)
+
+    for x in range(5):
+        registry.invoke_function("limited", x=x)
+
+    metrics = rate_limits.metrics()
+    assert metrics["invocations"] == 5
+    assert metrics["throttled"] == 3
+    assert now == pytest.approx(0.3)
+
+    # A call cancelled while throttled gives its slot back
+    throttled_limits = ResourceLimits(max_in_flight=1, rate=1)
+    registry.register_function(
+        lambda x: x, "throttled", limits=throttled_limits
+    )
+
+    async def cancel_throttled():
+        assert await registry.invoke_function_async("throttled", x=1) == 1
+
+        call = asyncio.ensure_future(
+            registry.invoke_function_async("throttled", x=2)
+        )
+        await asyncio.sleep(0.05)
+        call.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(cancel_throttled())
+    assert throttled_limits.metrics()["in_flight"] == 0
+
+
+def test_states_are_slotted_and_lazy(registry):
+
+    task = Task(name="add_two", resource="add_two", registry=registry)
+    pass_ = Pass(name="pass", x=5)
+
+    for obj in (task, pass_, Input(x=1), Result(1)):
+        assert not hasattr(obj, "__dict__")
+
+    task.compile()
+    assert task._result is None
+
+    assert pass_.input.inputs == {"x": 5}
+    assert pass_.result == {"x": 5}
+
+    pass_.result = 3
+    assert pass_.result == 3
+    assert pass_.compile()["pass"]["Result"] == {"result": 3}
+
+
+def test_unique_names():
+
+    names = {Pass().name for _ in range(10000)}
+    assert len(names) == 10000
+
+    machine = Machine.from_states(Pass() for _ in range(10000))
+    assert len(machine.states) == 10000
+
+    allocator = IdAllocator("machine")
+    assert allocator().startswith("machine-")
+    assert allocator() != allocator()
+
+
+def test_compile_to(registry):
+
+    machine = Machine.from_states(
+        Pass(result=x, name=f"pass_{x}") for x in range(100)
+    )
+    machine.register(
+        Task(name="add_two", resource="add_two", registry=registry)
+    )
+
+    expected = json.dumps(machine.compile())
+
+    text = io.StringIO()
+    machine.compile_to(text, buffer_size=100)
+    assert text.getvalue() == expected
+
+    # States registered since the last compile are compiled while streaming
+    machine.register(Pass(name="done"))
+
+    binary = io.BytesIO()
+    machine.compile_to(binary)
+
+    expected = json.dumps(machine.compile())
+    assert binary.getvalue() == expected.encode("utf-8")
+
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        machine.compile_to(writer)
+        writer.shutdown(socket.SHUT_WR)
+        received = b"".join(iter(lambda: reader.recv(4096), b""))
+
+    assert received == expected.encode("utf-8")
+
+
+def test_machine_from_asl(registry, tmp_path):
+
+    machine = Machine.from_states([
+        Pass(name="start"),
+        Task(name="add_two", resource="add_two", registry=registry),
+        Pass(result=Result(x=1, y=2), name="constant")
+    ])
+    compiled = machine.compile()
+
+    loaded = Machine.from_asl(compiled, registry=registry)
+
+    assert loaded.compile() == compiled
+    assert loaded.interpret(input=Input(x=1)) == 3
+    assert loaded.states["add_two"].registry is registry
+
+    path = tmp_path / "machine.json"
+    path.write_text(json.dumps(compiled))
+
+    assert Machine.from_asl(path, registry=registry).compile() == compiled
+    assert Machine.from_asl(str(path), registry=[registry]).compile() == \
+        compiled
+
+    with pytest.raises(RegistryException):
+        Machine.from_asl(compiled)
+
+
+def test_pass_result_fields_are_loaded_as_they_are():
+
+    for fields in ({"result": 0, "x": 1}, {"path": "$.x", "result": 2}):
+        machine = Machine.from_asl({
+            "StartAt": "constant",
+            "States": {
+                "constant": {"Type": "Pass", "Result": fields, "End": True}
+            }
+        })
+
+        assert machine.states["constant"].result.results == fields
+        assert machine.compile()["States"]["constant"]["Result"] == fields
+
+
+def test_machine_from_asl_lazily(registry):
+
+    document = {
+        "StartAt": "start",
+        "States": {
+            "unused": {
+                "Type": "Task",
+                "Resource": "unknown:fn",
+                "End": True
+            },
+            "add_two": {
+                "Type": "Task",
+                "Resource": "registry:add_two",
+                "End": True
+            },
+            "start": {
+                "Type": "Pass",
+                "Next": "add_two",
+                "End": False
+            }
+        }
+    }
+
+    machine = Machine.from_asl(document, registry=registry, lazy=True)
+
+    assert machine.start_at() == "start"
+    assert machine.compile()["States"] == document["States"]
+    assert all(
+        isinstance(machine.states.peek(name), DeferredState)
+        for name in machine.states
+    )
+
+    assert machine.interpret(input=Input(x=1)) == 3
+
+    assert isinstance(machine.states.peek("add_two"), Task)
+    assert isinstance(machine.states.peek("unused"), DeferredState)
+
+    with pytest.raises(RegistryException):
+        machine.states["unused"]
+
+
+def test_profiler(registry):
+
+    seen = []
+
+    profiler = Profiler(
+        before=lambda name, input: seen.append(("before", name)),
+        after=lambda name, input, output, duration: seen.append(
+            ("after", name)
+        ),
+        sample_rate=1.0
+    )
+
+    machine = Pass(name="start") + Task(
+        name="add_two",
+        resource="add_two",
+        registry=registry
+    )
+    machine.profiler = profiler
+
+    assert machine.interpret(input=Input(x=1)) == 3
+    assert seen == [
+        ("before", "start"), ("after", "start"),
+        ("before", "add_two"), ("after", "add_two")
+    ]
+
+    assert list(machine.interpret_many(Input(x=x) for x in range(3))) == \
+        [2, 3, 4]
+    assert asyncio.run(machine.interpret_async(input=Input(x=1))) == 3
+
+    assert profiler.stats["add_two"].calls == 5
+    assert profiler.stats["start"].errors == 0
+    assert {name for name, _ in profiler.report()} == {"start", "add_two"}
+
+    trace = profiler.traces[-1]
+    assert trace.state == "add_two"
+    assert trace.input_size == len('{"x": 1}')
+    assert trace.output_size == len('{"result": 3}')
+
+    with pytest.raises(TypeError):
+        machine.interpret(input=Input(y=1))
+    assert profiler.stats["add_two"].errors == 1
+
+    profiler.reset()
+    assert not profiler.stats and not profiler.traces
+
+
+def test_concurrent_executions_of_one_machine(registry):
+
+    machine = Pass(name="start") + Task(
+        name="add_two",
+        resource="add_two",
+        registry=registry
+    )
+
+    results = {}
+
+    def interpret(x):
+        for _ in range(200):
+            output = machine.interpret(input=Input(x=x))
+            assert machine.result is output
+        results[x] = output
+
+    threads = [
+        threading.Thread(target=interpret, args=(x,)) for x in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {x: x + 2 for x in range(8)}
+
+    execution = machine.execute(input=Input(x=1))
+    assert execution.done and execution.state is None
+    assert execution.output == 3
+    assert execution.duration >= 0
+    assert execution.id != machine.execute(input=Input(x=1)).id
+
+
+class TaggedPass(Pass):
+
+    def __init__(self, tag, **kwargs):
+        Pass.__init__(self, **kwargs)
+        self.tag = tag
+
+
+class FlakyPass(Pass):
+    """ A Pass state failing the first time it is interpreted
+    """
+
+    failures = 1
+
+    def interpret(self, input=None):
+        if FlakyPass.failures:
+            FlakyPass.failures -= 1
+            raise RuntimeError("Interrupted")
+        return Pass.interpret(self, input=input)
+
+
+def test_resume_from_checkpoint(registry, tmp_path):
+
+    calls = []
+
+    def add_two(x):
+        calls.append(x)
+        return x + 2
+
+    registry.register_function(add_two, "counted_add_two")
+
+    machine = Task(
+        name="add_two",
+        resource="counted_add_two",
+        registry=registry
+    ) + FlakyPass(name="flaky") + Pass(name="done")
+
+    machine.checkpoint = CheckpointLog(str(tmp_path / "log.db"))
+
+    with pytest.raises(RuntimeError):
+        machine.execute(input=Input(x=1), id="job")
+
+    execution = machine.resume("job")
+    assert execution.output == 3
+    assert calls == [1]
+
+    # Resuming a completed execution returns its output
+    assert machine.resume("job").output == 3
+
+    # A new log on the same file sees the recorded executions
+    machine.checkpoint = CheckpointLog(str(tmp_path / "log.db"))
+    assert machine.resume("job").output == 3
+    assert calls == [1]
+
+    with pytest.raises(OperationalError):
+        machine.resume("unknown")
+
+
+def test_choice_rules():
+
+    choice = Choice(
+        choices=[
+            {"Variable": "$.x", "NumericGreaterThan": 100, "Next": "large"},
+            {"Variable": "$.x", "NumericEquals": 1, "Next": "one"},
+            {"Variable": "$.kind", "StringEquals": "a", "Next": "a"},
+            {"Variable": "$.kind", "StringMatches": "b*", "Next": "b"},
+            {"Variable": "$.x", "NumericEquals": 2, "Next": "two"},
+            {
+                "And": [
+                    {"Variable": "$.flag", "IsPresent": True},
+                    {"Not": {"Variable": "$.flag", "BooleanEquals": False}}
+                ],
+                "Next": "flagged"
+            },
+            {"Variable": "$.kind", "StringEquals": "a", "Next": "unreachable"}
+        ],
+        default="other",
+        name="route"
+    )
+
+    assert choice.choose(Input(x=1)) == "one"
+    assert choice.choose(Input(x=1.0, kind="a")) == "one"
+    assert choice.choose(Input(x="1", kind="a")) == "a"
+    assert choice.choose(Input(x=True)) == "other"
+    assert choice.choose(Input(x=101, kind="a")) == "large"
+    assert choice.choose(Input(kind="bee", x=2)) == "b"
+    assert choice.choose(Input(x=2)) == "two"
+    assert choice.choose(Input(flag=True)) == "flagged"
+    assert choice.choose(Input(flag=False)) == "other"
+    assert choice.choose(Result(3)) == "other"
+
+    assert choice.compile()["route"]["Default"] == "other"
+    assert "End" not in choice.compile()["route"]
+
+    with pytest.raises(NoChoiceMatchedException):
+        Choice(choices=choice.choices, name="strict").choose(Input())
+
+
+def test_interpret_choice(registry):
+
+    routes = 300
+
+    registry.register_function(lambda route, x: x + 2, "routed_add_two")
+
+    document = {
+        "StartAt": "route",
+        "States": {
+            "route": {
+                "Type": "Choice",
+                "Choices": [
+                    {
+                        "Variable": "$.route",
+                        "StringEquals": f"route_{index}",
+                        "Next": f"route_{index}"
+                    }
+                    for index in range(routes)
+                ],
+                "Default": "add_two"
+            },
+            "add_two": {
+                "Type": "Task",
+                "Resource": "registry:routed_add_two",
+                "End": True
+            },
+            **{
+                f"route_{index}": {
+                    "Type": "Pass",
+                    "Result": {"route": index},
+                    "ResultPath": "$.result",
+                    "End": True
+                }
+                for index in range(routes)
+            }
+        }
+    }
+
+    for lazy in (False, True):
+        machine = Machine.from_asl(document, registry=registry, lazy=lazy)
+
+        assert machine.compile()["States"]["route"] == \
+            document["States"]["route"]
+
+        # A Pass state with a result passes a non empty input through
+        assert machine.interpret(input=Input(route="route_7")).inputs == \
+            {"route": "route_7"}
+        assert machine.interpret(input=Input(x=1, route="none")) == 3
+
+        execution = machine.execute(input=Input(route="route_299"))
+        assert execution.done
+
+        # Unless Pass states are loaded placing their result at their
+        # ResultPath
+        machine = Machine.from_asl(
+            document, registry=registry, lazy=lazy, pass_result_paths=True
+        )
+        assert machine.interpret(input=Input(route="route_7")).inputs == \
+            {"route": "route_7", "result": {"route": 7}}
+
+    machine = Machine()
+    machine.register(Choice(
+        choices=[{"Variable": "$.x", "NumericEquals": 1, "Next": "missing"}],
+        name="route"
+    ))
+
+    with pytest.raises(OperationalError):
+        machine.interpret(input=Input(x=1))
+
+
+def test_map_state(registry):
+
+    iterator = Pass(name="start") + Task(
+        name="add_two",
+        resource="add_two",
+        registry=registry
+    )
+
+    machine = Machine()
+    machine.register(Map(
+        iterator,
+        items_path="$.items",
+        max_concurrency=4,
+        name="map",
+        end=True
+    ))
+
+    items = [{"x": x} for x in range(100)]
+    result = machine.interpret(input=Input(items=items))
+
+    assert result.results["result"] == \
+        [{"result": x + 2} for x in range(100)]
+
+    compiled = machine.compile()["States"]["map"]
+    assert compiled["ItemsPath"] == "$.items"
+    assert compiled["MaxConcurrency"] == 4
+    assert compiled["Iterator"] == iterator.compile()
+
+    loaded = Machine.from_asl(machine.compile(), registry=registry)
+    assert loaded.interpret(input=Input(items=items)) == result
+    assert asyncio.run(loaded.interpret_async(input=Input(items=items))) == \
+        result
+
+    with pytest.raises(MapItemsException):
+        machine.interpret(input=Input(items=1))
+
+    # A pool shared between interpretations runs the chunks of the items
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        machine.states["map"].executor = executor
+
+        for _ in range(3):
+            assert machine.interpret(input=Input(items=items)) == result
+
+        state = Map(Pass() + Pass(), name="shared", executor=executor)
+        assert pickle.loads(pickle.dumps(state)).executor is None
+
+    # A Map state nested in one sharing its executor interprets its items
+    # on the worker running them rather than waiting on the executor
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        inner = Machine()
+        inner.register(Map(
+            Pass() + Pass(), items_path="$.items", max_concurrency=2,
+            name="inner", end=True, executor=executor
+        ))
+        outer = Machine()
+        outer.register(Map(
+            inner, items_path="$.items", max_concurrency=2, name="outer",
+            end=True, executor=executor
+        ))
+
+        groups = [{"items": [{"x": x} for x in range(4)]}] * 4
+
+        with ThreadPoolExecutor(max_workers=1) as caller:
+            result = caller.submit(
+                outer.interpret, Input(items=groups)
+            ).result(timeout=10)
+
+        assert result.results["result"] == \
+            [{"result": [{"x": x} for x in range(4)]}] * 4
+
+
+def test_states_of_subclasses_are_pickled():
+
+    state = pickle.loads(pickle.dumps(TaggedPass("tagged", name="tagged")))
+
+    assert state.tag == "tagged"
+    assert state.name == "tagged"
+
+
+def test_map_state_with_processes():
+
+    registry = Registry()
+    registry.register_function("test_machine:add_three", "add_three")
+
+    iterator = Pass(name="start") + Task(
+        name="add_three",
+        resource="add_three",
+        registry=registry
+    )
+
+    machine = Machine()
+    machine.register(Map(
+        iterator,
+        max_concurrency=2,
+        name="map",
+        end=True,
+        processes=True
+    ))
+
+    result = machine.interpret(input=[{"x": x} for x in range(20)])
+
+    assert result.results["result"] == \
+        [{"result": x + 3} for x in range(20)]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        machine.states["map"].executor = executor
+
+        for _ in range(2):
+            assert machine.interpret(
+                input=[{"x": x} for x in range(20)]
+            ) == result
+
+
+def test_parallel_state():
+
+    registry = Registry()
+
+    # Each function returns once the four branches call it at once, so the
+    # branches only complete when they are interpreted concurrently
+    barrier = threading.Barrier(4, timeout=5)
+    calls = []
+
+    def slow_add(x, y):
+        barrier.wait()
+        return x + y
+
+    async def slow_add_async(x, y):
+        calls.append(None)
+        for _ in range(500):
+            if not len(calls) % 4:
+                return x + y
+            await asyncio.sleep(0.01)
+        raise TimeoutError("The branches were not interpreted at once")
+
+    registry.register_function(slow_add, "slow_add")
+    registry.register_function(slow_add_async, "slow_add_async")
+
+    for resource in ("slow_add", "slow_add_async"):
+        branches = [
+            Pass(name=f"start_{index}") + Task(
+                name=f"add_{index}",
+                resource=resource,
+                registry=registry
+            )
+            for index in range(4)
+        ]
+
+        machine = Machine()
+        machine.register(Parallel(branches, name="parallel", end=True))
+
+        result = machine.interpret(input=Input(x=1, y=2))
+        assert result.results["result"] == [{"result": 3}] * 4
+
+        loaded = Machine.from_asl(machine.compile(), registry=registry)
+        assert loaded.compile() == machine.compile()
+        assert asyncio.run(loaded.interpret_async(input=Input(x=1, y=2))) \
+            == result
+
+    # Whether branches await coroutine functions is found without building
+    # deferred states, including those of nested Map states
+    document = {
+        "StartAt": "parallel",
+        "States": {
+            "parallel": {
+                "Type": "Parallel",
+                "Branches": [{
+                    "StartAt": "map",
+                    "States": {
+                        "map": {
+                            "Type": "Map",
+                            "Iterator": {
+                                "StartAt": "add",
+                                "States": {
+                                    "add": {
+                                        "Type": "Task",
+                                        "Resource": "registry:slow_add_async",
+                                        "End": True
+                                    }
+                                }
+                            },
+                            "End": True
+                        }
+                    }
+                }],
+                "End": True
+            }
+        }
+    }
+
+    loaded = Machine.from_asl(document, registry=registry, lazy=True)
+    assert loaded.asynchronous()
+    assert isinstance(loaded.states.peek("parallel"), DeferredState)
+
+    parallel = Machine.from_asl(document, registry=registry).states["parallel"]
+    assert parallel.asynchronous()
+
+
+def test_wait_state():
+
+    machine = Machine()
+    machine.register(Wait(seconds=0, name="wait", next="end"))
+    machine.register(Pass(name="end", end=True))
+
+    assert machine.interpret(input=Input(x=1)).inputs == {"x": 1}
+    assert asyncio.run(machine.interpret_async(input=Input(x=1))).inputs == \
+        {"x": 1}
+
+    wait = Wait(timestamp_path="$.at", name="wait", end=True)
+    assert wait.delay({"at": "1970-01-01T00:01:00Z"}, 20) == 40
+    assert wait.delay({"at": "1970-01-01T00:00:00"}, 20) == 0
+
+    with pytest.raises(InvalidWaitException):
+        wait.delay({}, 0)
+
+    with pytest.raises(InvalidWaitException):
+        Wait(seconds=1, timestamp="1970-01-01T00:00:00Z")
+
+    loaded = Machine.from_asl(machine.compile())
+    assert loaded.compile() == machine.compile()
+    assert loaded.compile()["States"]["wait"]["Seconds"] == 0
+
+
+def test_scheduler_with_virtual_clock():
+
+    machine = Machine()
+    machine.register(Pass(name="start", next="wait"))
+    machine.register(Wait(seconds_path="$.delay", name="wait", next="end"))
+    machine.register(Pass(name="end", end=True))
+
+    clock = VirtualClock(start=100.0)
+    scheduler = Scheduler(clock=clock, sleep=clock.sleep)
+
+    executions = [
+        scheduler.submit(machine, input=Input(delay=delay))
+        for delay in (30, 10, 20)
+    ]
+    failing = scheduler.submit(machine, input=Input(delay="soon"))
+
+    assert scheduler.pending == 4
+
+    started = time.perf_counter()
+    assert scheduler.run(until=115.0) == 2
+    assert clock() == 115.0
+    assert [execution.done for execution in executions] == \
+        [False, True, False]
+    assert isinstance(failing.error, InvalidWaitException)
+
+    assert scheduler.run() == 2
+    assert time.perf_counter() - started < 1
+    assert clock() == 130.0
+    assert scheduler.completed == 3 and scheduler.failed == 1
+    assert [execution.output.inputs for execution in executions] == \
+        [{"delay": 30}, {"delay": 10}, {"delay": 20}]
+
+
+def test_task_retry_and_catch():
+
+    registry = Registry()
+    failures = {}
+
+    def flaky_add(x, key, fail=2):
+        failures[key] = failures.get(key, 0) + 1
+        if failures[key] <= fail:
+            raise ConnectionError(f"attempt {failures[key]}")
+        return x + 1
+
+    def fail(**inputs):
+        raise ValueError("always")
+
+    registry.register_function(flaky_add, "flaky_add")
+    registry.register_function(fail, "fail")
+
+    retry = [{
+        "ErrorEquals": ["OSError"],
+        "IntervalSeconds": 0.01,
+        "MaxAttempts": 2,
+        "BackoffRate": 1.0
+    }]
+    catch = [{
+        "ErrorEquals": ["States.ALL"],
+        "ResultPath": "$.error",
+        "Next": "caught"
+    }]
+
+    machine = Machine()
+    machine.register(Pass(name="start", next="add"), link=False)
+    machine.register(Task(
+        name="add", resource="flaky_add", registry=registry, end=True,
+        retry=retry, catch=catch
+    ), link=False)
+    machine.register(Pass(name="caught", end=True), link=False)
+
+    assert machine.plan().transitions[machine.plan().index["add"]] == -1
+
+    assert machine.interpret(input=Input(x=1, key="sync")) == 2
+    assert asyncio.run(
+        machine.interpret_async(input=Input(x=1, key="async"))
+    ) == 2
+    assert failures["sync"] == failures["async"] == 3
+    assert machine.interpret(input=Input(x=1, key="more", fail=3)).inputs == {
+        "x": 1,
+        "key": "more",
+        "fail": 3,
+        "error": {"Error": "ConnectionError", "Cause": "attempt 3"}
+    }
+
+    compiled = machine.compile()
+    assert compiled["States"]["add"]["Retry"] == retry
+    assert compiled["States"]["add"]["Catch"] == catch
+
+    for lazy in (False, True):
+        loaded = Machine.from_asl(compiled, registry=registry, lazy=lazy)
+        assert loaded.compile() == compiled
+        assert loaded.interpret(input=Input(x=1, key=f"lazy_{lazy}")) == 2
+
+    machine.register(Task(
+        name="add", resource="fail", registry=registry, end=True,
+        retry=retry
+    ), force=True, link=False)
+
+    with pytest.raises(ValueError):
+        machine.interpret(input=Input(x=1))
+
+
+def test_scheduler_backs_off_without_blocking_workers():
+
+    registry = Registry()
+    failures = []
+
+    def flaky_add(x):
+        if x == 0 and not failures:
+            failures.append(x)
+            raise ConnectionError()
+        return x + 1
+
+    registry.register_function(flaky_add, "flaky_add")
+
+    machine = Machine()
+    machine.register(Pass(name="start", next="add"))
+    machine.register(Task(
+        name="add", resource="flaky_add", registry=registry, end=True,
+        retry=[{"ErrorEquals": ["States.ALL"], "IntervalSeconds": 0.3}]
+    ))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = Scheduler(executor=executor)
+        executions = [
+            scheduler.submit(machine, input=Input(x=x)) for x in range(20)
+        ]
+
+        started = time.perf_counter()
+        assert scheduler.run() == 20
+
+    assert time.perf_counter() - started < 0.6
+    assert [execution.output for execution in executions] == \
+        list(range(1, 21))
+    assert max(execution.finished for execution in executions[1:]) < \
+        executions[0].finished
+
+
+def test_input_result_and_output_paths(registry):
+
+    registry.register_function(lambda x: x * 2, "double")
+    registry.register_function(lambda **args: args, "log")
+
+    machine = Machine()
+    machine.register(Task(
+        name="double", resource="double", registry=registry, next="add",
+        input_path="$.args", result_path="$.args.y"
+    ))
+    machine.register(Task(
+        name="add", resource="add_two_args", registry=registry, next="log",
+        input_path="$.args", result_path="$.sum"
+    ))
+    machine.register(Task(
+        name="log", resource="log", registry=registry, next="sum",
+        input_path="$.args", result_path=DISCARD
+    ))
+    machine.register(Pass(name="sum", end=True, output_path="$.sum"))
+
+    payload = {"items": list(range(1000))}
+    data = {"args": {"x": 3}, "payload": payload}
+
+    execution = machine.execute(input=Input(**data))
+    assert execution.output.inputs == {"input": 9}
+    assert data == {"args": {"x": 3}, "payload": payload}
+
+    # The data off the paths set is passed on without copies
+    assert execution.data is execution.output
+    add = machine.plan().handlers[1]
+    output = add(input=Input(args={"x": 3, "y": 6}, payload=payload))
+    assert output.inputs["sum"] == 9
+    assert output.inputs["payload"] is payload
+
+    compiled = machine.compile()["States"]
+    assert compiled["double"]["InputPath"] == "$.args"
+    assert compiled["double"]["ResultPath"] == "$.args.y"
+    assert compiled["log"]["ResultPath"] is None
+    assert compiled["sum"]["OutputPath"] == "$.sum"
+
+    for lazy in (False, True):
+        loaded = Machine.from_asl(
+            json.loads(json.dumps(machine.compile())),
+            registry=registry,
+            lazy=lazy
+        )
+        assert loaded.compile() == machine.compile()
+        assert loaded.interpret(input=Input(**data)).inputs == {"input": 9}
+
+    with pytest.raises(PathNotFoundException):
+        machine.interpret(input=Input(x=3))
+
+    # Choice rules apply to the input of the state, and its OutputPath to
+    # the data passed on
+    routed = Machine()
+    routed.register(Choice(
+        choices=[{"Variable": "$.kind", "StringEquals": "a", "Next": "A"}],
+        default="B",
+        name="c",
+        output_path="$.payload"
+    ))
+    routed.register(Pass(name="A", end=True), link=False)
+    routed.register(Pass(name="B", end=True), link=False)
+    routed.profiler = Profiler()
+
+    output = routed.interpret(input=Input(kind="a", payload={"y": 1}))
+    assert output.inputs == {"y": 1}
+    assert set(routed.profiler.stats) == {"c", "A"}
+
+    routed.states["c"].input_path = "$.args"
+    routed.states["c"].output_path = None
+    routed.invalidate("c")
+    routed.profiler = Profiler()
+
+    data = Input(args={"kind": "a"}, kind="b")
+    assert routed.interpret(input=data).inputs == {"kind": "a"}
+    assert asyncio.run(routed.interpret_async(input=data)).inputs == \
+        {"kind": "a"}
+    assert set(routed.profiler.stats) == {"c", "A"}
+
+    # Results are only set at paths fitting the data they are given
+    set_sum = compile_setter("$.args.sum")
+    assert set_sum({"x": 3}, 9, "add") == {"x": 3, "args": {"sum": 9}}
+
+    for data in ({"args": 3}, {"args": [3]}):
+        with pytest.raises(PathNotFoundException):
+            set_sum(data, 9, "add")
+
+    with pytest.raises(PathNotFoundException):
+        compile_setter("$.args[1]")({"args": [3]}, 9, "add")
+
+
+def test_pass_result_paths():
+
+    document = {
+        "StartAt": "constant",
+        "States": {
+            "constant": {"Type": "Pass", "Result": 5, "Next": "nested"},
+            "nested": {
+                "Type": "Pass",
+                "Result": {"y": 2},
+                "ResultPath": "$.args",
+                "Next": "through"
+            },
+            "through": {"Type": "Pass", "ResultPath": "$.copy", "Next": "end"},
+            "end": {"Type": "Pass", "Result": 1, "ResultPath": None,
+                    "End": True}
+        }
+    }
+
+    for lazy in (False, True):
+        machine = Machine.from_asl(
+            document, lazy=lazy, pass_result_paths=True
+        )
+        assert machine.interpret(input=Input(x=1)).inputs == {
+            "input": 5,
+            "args": {"y": 2},
+            "copy": {"input": 5, "args": {"y": 2}}
+        }
+        assert machine.compile()["States"]["constant"]["ResultPath"] == "$"
+        assert machine.compile()["States"]["end"]["ResultPath"] is None
+
+    machine = Machine()
+    machine.register(Pass(
+        result=Result(3), name="constant", result_path="$.z", end=True
+    ))
+    assert machine.interpret(input=Input(x=1)).inputs == {"x": 1, "z": 3}
+
+
+def test_validate_machine():
+
+    machine = Machine.from_states(Pass(name=f"state_{i}") for i in range(100))
+    machine.validate()
+
+    # States linked to the machine extend the graph checks already made
+    reached = machine._reached
+    machine.register(Pass(name="state_100"))
+    machine.validate()
+    assert machine._reached is reached and len(reached) == 101
+
+    machine.register(Pass(name="jump", next="missing"), link=False)
+
+    with pytest.raises(InvalidMachineException) as error:
+        machine.validate()
+
+    assert error.value.problems == [
+        "State jump transitions to unknown state missing",
+        "Not reachable from the start state state_0: jump"
+    ]
+
+    # Registering the state transitioned to resolves it, and states
+    # modified directly are validated again once invalidated
+    machine.register(Pass(name="missing", next="jump"), link=False)
+    machine.states["state_100"].next = "jump"
+    machine.states["state_100"].end = False
+    machine.invalidate("state_100")
+
+    with pytest.raises(InvalidMachineException) as error:
+        machine.validate()
+
+    assert error.value.problems == [
+        "Cycle without a Choice state: jump -> missing -> jump"
+    ]
+
+    # A Choice state can leave the cycle
+    machine.register(Choice(
+        choices=[{"Variable": "$.done", "BooleanEquals": True, "Next": "end"}],
+        default="jump",
+        name="missing"
+    ), force=True, link=False)
+    machine.register(Pass(name="end", end=True), link=False)
+    machine.validate()
+
+    # The compiled document is shared with the machine, so is copied
+    document = copy.deepcopy(machine.compile())
+    document["States"]["end"]["Next"] = "nowhere"
+    document["States"]["end"]["End"] = False
+
+    loaded = Machine.from_asl(document, lazy=True)
+
+    with pytest.raises(InvalidMachineException):
+        loaded.validate()
+
+    assert all(
+        isinstance(loaded.states.peek(name), DeferredState)
+        for name in loaded.states
+    )
+
+    # Rules without a Next state are reported rather than raising
+    document = {
+        "StartAt": "choose",
+        "States": {
+            "choose": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.x", "NumericEquals": 1}],
+                "Default": "end"
+            },
+            "end": {"Type": "Pass", "End": True}
+        }
+    }
+
+    for lazy in (False, True):
+        loaded = Machine.from_asl(document, lazy=lazy)
+
+        with pytest.raises(InvalidMachineException) as error:
+            loaded.validate()
+
+        assert error.value.problems == [
+            "State choose is invalid: Choice rule " \
+            "{'Variable': '$.x', 'NumericEquals': 1} has no Next state"
+        ]
+
+    registry = Registry()
+    registry.register_function(lambda: None, "noop")
+
+    machine = Machine()
+    machine.register(Task(
+        name="task", resource="noop", registry=registry,
+        catch=[{"ErrorEquals": ["States.ALL"]}]
+    ))
+
+    with pytest.raises(InvalidMachineException) as error:
+        machine.validate()
+
+    assert error.value.problems == [
+        "State task is invalid: Catch rule " \
+        "{'ErrorEquals': ['States.ALL']} of state task has no Next state"
+    ]
+
+    iterator = Machine()
+    iterator.register(Pass(name="loop", next="loop"), link=False)
+
+    machine = Machine()
+    machine.register(Map(iterator, name="map"))
+
+    with pytest.raises(InvalidMachineException) as error:
+        machine.validate()
+
+    assert error.value.problems == [
+        "State map has an invalid machine: Cycle without a Choice state: " \
+        "loop -> loop"
+    ]
+
+    # The nested machines of a valid machine are validated again, as they
+    # may be modified on their own
+    iterator = Pass(name="first") + Pass(name="second")
+    machine = Machine()
+    machine.register(Map(iterator, name="map"))
+    machine.validate()
+
+    iterator.register(Pass(name="jump", next="missing"), link=False)
+
+    with pytest.raises(InvalidMachineException):
+        machine.validate()
+
+
+def test_fingerprint_and_machine_cache(registry, tmp_path):
+
+    def build(result=1):
+        return Pass() + Task(resource="add_two", registry=registry) + \
+            Pass(result=Result(result))
+
+    machine = build()
+
+    assert machine.fingerprint() == build().fingerprint()
+    assert machine.fingerprint() != build(result=2).fingerprint()
+
+    # Strings which look like generated names are kept in results
+    assert build(result="deadbeef-1").fingerprint() != \
+        build(result="01234567-2").fingerprint()
+
+    fingerprint = machine.fingerprint()
+    machine.register(Pass(name="last"))
+    assert machine.fingerprint() != fingerprint
+
+    cache = MachineCache(str(tmp_path / "machines"))
+    fingerprint = cache.put(machine)
+
+    assert fingerprint in cache
+    assert cache.put(build() + Pass(name="last")) == fingerprint
+    assert len(list((tmp_path / "machines").iterdir())) == 1
+    assert cache.get("missing") is None
+
+    loaded = cache.get(fingerprint, registry=registry)
+
+    assert loaded.fingerprint() == fingerprint
+    assert loaded.compile() == machine.compile()
+    assert loaded.plan().transitions == machine.plan().transitions
+    assert loaded.interpret(input=Input(x=1)) == 3
+
+
+def test_optimize_fuses_pass_chains(registry):
+
+    machine = Machine()
+    machine.register(Pass(name="forward_0"))
+    machine.register(Pass(name="forward_1"))
+    machine.register(Pass(name="empty", result=Result(0)))
+    machine.register(Pass(name="constant", result=Result(5)))
+    machine.register(Choice(
+        choices=[{"Variable": "$.result", "NumericEquals": 5, "Next": "add"}],
+        default="after",
+        name="route"
+    ), link=False)
+    machine.states["constant"].next = "route"
+    machine.states["constant"].end = False
+    machine.register(Pass(name="after", next="add"), link=False)
+    machine.register(Pass(name="before_add", next="add"), link=False)
+    machine.register(Task(
+        name="add", resource="total", registry=registry, end=True,
+        input_path="$"
+    ), link=False)
+    machine.invalidate()
+
+    registry.register_function(
+        lambda **values: sum(values.values()), "total"
+    )
+
+    def interpret_all():
+        return [
+            document(machine.interpret(input=input))
+            for input in (None, Input(x=1), Result(0), Result(result=2))
+        ]
+
+    expected = interpret_all()
+    assert expected == [{"input": 5}, {"input": 1}, {"input": 5}, {"input": 2}]
+
+    compiled = machine.compile()
+    machine.optimize = True
+    plan = machine.plan()
+
+    assert plan.fused == {
+        "forward_0": ("forward_0", "forward_1", "empty", "constant")
+    }
+    assert plan.transitions[0] == plan.index["route"]
+    assert plan.follow(0, None) == plan.index["forward_1"]
+    assert interpret_all() == expected
+    assert machine.compile() == compiled
+
+    # The states of a fused chain are reported under their own names
+    machine.profiler = Profiler(sample_rate=1.0)
+    machine.interpret()
+    chain = plan.fused["forward_0"]
+    assert {name for name, _ in machine.profiler.report()} == \
+        {*chain, "route", "add"}
+    assert all(
+        machine.profiler.stats[name].fused == chain for name in chain
+    )
+    assert machine.profiler.stats["route"].fused is None
+    assert [trace.fused for trace in machine.profiler.traces] == \
+        [chain, None, None]